@@ -1,21 +1,22 @@
 from django.contrib import admin, messages
-from django.http import HttpResponseRedirect
-from django.urls import reverse
-from django.utils.http import urlencode
+from django.db.models import Prefetch
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from .models import *
-from .utils import helper
-from datetime import datetime
-from django.utils import timezone
+from .utils import helper, payments, read_state, search
 from django.utils.translation import gettext as _
 from django.utils.translation import gettext_lazy as _lazy_
-from unfold.contrib.filters.admin import RangeDateFilter, RangeNumericFilter, FieldTextFilter
+from unfold.contrib.filters.admin import RangeDateFilter, RangeNumericFilter, RangeNumericListFilter, FieldTextFilter
 from django.contrib import admin
 from unfold.admin import ModelAdmin
+from unfold.views import ChangeList
+from django.contrib.admin.views.main import ORDER_VAR
 from unfold.decorators import action, display
 from unfold.contrib.inlines.admin import StackedInline, TabularInline
 from simple_history.admin import SimpleHistoryAdmin
 from django import forms
 from .sites import saranalaya_admin_site
+from .tasks import refresh_dashboard_snapshot
 from django_celery_beat.models import (
     ClockedSchedule,
     CrontabSchedule,
@@ -73,6 +74,28 @@ class AdoptionSponsoringForm(forms.ModelForm):
         
 
 # FILTERS #
+class ReadStatusFilter(admin.SimpleListFilter):
+
+    title = _('Read Status')
+    parameter_name = 'read_status'
+
+    def lookups(self, request, model_admin):
+        return [
+            ("unread", _("Unread")),
+            ("read", _("Read")),
+        ]
+
+    def queryset(self, request, queryset):
+        # is_unread is annotated by the get_queryset of the model admins
+        if self.value() == "unread":
+            return queryset.filter(is_unread=True)
+
+        elif self.value() == "read":
+            return queryset.filter(is_unread=False)
+
+        return queryset
+
+
 class AmountOfAdoptionParentsFilter(admin.SimpleListFilter):
 
     title = _('Amount of Adoption Parents')
@@ -88,72 +111,122 @@ class AmountOfAdoptionParentsFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
-        
-        ap_count = {}
-        for ap in AdoptionParent.objects.all():
-            children = ap.children.all()
-
-            for child in children:
-                if child in ap_count:
-                    ap_count[child] += 1
-                else:
-                    ap_count[child] = 1
-
-        if self.value() == "0":
-            all_children = list(Child.objects.all())
-            children_with_ap = [ch[0] for ch in ap_count.items()]
-            # remaining_children = all_children.difference(children_with_ap)
-            set_difference = set(all_children) - set(children_with_ap)
-            remaining_children = list(set_difference)
-
-            correct_ch = [ch.pk for ch in remaining_children]
-            return queryset.filter(
-                id__in=correct_ch
-            )
-        
-        elif self.value() == "1":
-            correct_aps = list(filter(
-                lambda a: a[1] == 1,
-                ap_count.items(),
-            ))
-            correct_aps = [ch[0].pk for ch in correct_aps]
-            return queryset.filter(
-                id__in=correct_aps
-            )
-        
-        elif self.value() == "2":
-            correct_aps = list(filter(
-                lambda a: a[1] == 2,
-                ap_count.items(),
-            ))
-            correct_aps = [ch[0].pk for ch in correct_aps]
-            return queryset.filter(
-                id__in=correct_aps
-            )
-        
-        elif self.value() == "3":
-            correct_aps = list(filter(
-                lambda a: a[1] == 3,
-                ap_count.items(),
-            ))
-            correct_aps = [ch[0].pk for ch in correct_aps]
-            return queryset.filter(
-                id__in=correct_aps
-            )
-
-        elif self.value() == "3+":
-            correct_aps = list(filter(
-                lambda a: a[1] > 3,
-                ap_count.items(),
-            ))
-            correct_aps = [ch[0].pk for ch in correct_aps]
-            return queryset.filter(
-                id__in=correct_aps
-            )
-        
+        # adoption_parent_count is annotated by ChildAdmin.get_queryset
+        if self.value() == "3+":
+            return queryset.filter(adoption_parent_count__gt=3)
+
+        elif self.value() in ("0", "1", "2", "3"):
+            return queryset.filter(adoption_parent_count=int(self.value()))
 
         return queryset
-  
+
+
+
+class AmountLeftFilter(admin.SimpleListFilter):
+
+    title = _('Amount remaining')
+    parameter_name = 'amount_left'
+
+    def lookups(self, request, model_admin):
+        return [
+            ("nothing", _("Nothing paid")),
+            ("partially", _("Partially paid")),
+            ("paid", _("Paid in full")),
+        ]
+
+    def queryset(self, request, queryset):
+        # amount_left is annotated by AdoptionParentSponsoringAdmin.get_queryset
+        if self.value() == "nothing":
+            return queryset.filter(amount__lte=0)
+
+        elif self.value() == "partially":
+            return queryset.filter(amount__gt=0, amount_left__gt=0)
+
+        elif self.value() == "paid":
+            return queryset.filter(amount_left=0)
+
+        return queryset
+
+
+class ArrearsFilter(admin.SimpleListFilter):
+
+    title = _('Arrears')
+    parameter_name = 'arrears'
+
+    def lookups(self, request, model_admin):
+        return [
+            ("behind", _("Behind on payments")),
+            ("up_to_date", _("Paid for the year")),
+        ]
+
+    def queryset(self, request, queryset):
+        # year_amount_left is annotated by AdoptionParentSponsoringAdmin.get_queryset
+        if self.value() == "behind":
+            return queryset.filter(year_amount_left__gt=0)
+
+        elif self.value() == "up_to_date":
+            return queryset.filter(year_amount_left=0)
+
+        return queryset
+
+
+# the donation totals are annotated by SponsorAdmin.get_queryset
+class DonationTotalFilter(RangeNumericListFilter):
+    title = _('Total Donated')
+    parameter_name = 'donation_total'
+
+
+class DonationsThisYearFilter(RangeNumericListFilter):
+    title = _('Donated This Year')
+    parameter_name = 'donations_this_year'
+
+
+class DonationCountFilter(RangeNumericListFilter):
+    title = _('Amount of Donations')
+    parameter_name = 'donation_count'
+
+
+def format_amount_left(amount_left):
+    # paymentcolor.js colours the cell based on the part of the yearly amount that is missing
+    return format_html(
+        '<span data-amount-left="{}" data-amount="{}">{}</span>',
+        amount_left, Configuration.get().amount_adoption_parents, f"{amount_left:g}",
+    )
+
+
+def format_read_state(obj, value):
+    # Return HTML with a red dot if the object changed since the user last viewed it
+    red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
+    return format_html('<div class="flex items-center">{} <span>{}</span></div>', mark_safe(red_dot if obj.is_unread else ''), value)
+
+
+
+# SEARCH #
+class SearchRankChangeList(ChangeList):
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+
+        # best matches first, unless the user sorts on a column
+        if 'search_rank' in queryset.query.annotations and not self.params.get(ORDER_VAR):
+            return ['-search_rank'] + ordering
+
+        return ordering
+
+
+class FullTextSearchMixin:
+    # searches the maintained search vector and trigram indexes instead of
+    # an icontains over every search field, outside of postgres search_fields is still used
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip() or not search.is_supported():
+            return super().get_search_results(request, queryset, search_term)
+
+        return search.search(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return SearchRankChangeList
+
 
 
 # INLINES #
@@ -179,13 +252,16 @@ class AdoptionParentSponsoringInline(StackedInline):
 
 class DonationInline(StackedInline):
     model = Donation
+    ordering = ('-date',)
+    # the totals are columns of the changelist, no need to load every donation
+    per_page = 10
 
 
 
 # MODELS #
 
 @admin.register(AdoptionParent, site=saranalaya_admin_site)
-class AdoptionParentAdmin(SimpleHistoryAdmin, ModelAdmin):
+class AdoptionParentAdmin(FullTextSearchMixin, SimpleHistoryAdmin, ModelAdmin):
     list_display = ('changed_and_first_name', 'last_name', 'get_children')
     exclude = ('children',)
     ordering = ('first_name', 'last_name')
@@ -196,6 +272,7 @@ class AdoptionParentAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     search_fields = ('first_name', 'last_name', 'firm', 'street_name', 'address_number', 'bus', 'postcode', 'city', 'country', 'mail', 'description', 'phone_number', 'children__name', 'children__description')
     list_filter = (
+        ReadStatusFilter,
         ('active', admin.BooleanFieldListFilter), 
         'country', 
         'children', 
@@ -207,125 +284,81 @@ class AdoptionParentAdmin(SimpleHistoryAdmin, ModelAdmin):
     actions = [
         "add_new_sponsoring",
         "generate_address_list",
+        "generate_address_labels",
         "generate_mail_list",
         "mark_as_read",
         "mark_as_unread",
+        "export_csv",
+        "export_xlsx",
     ]
 
     @action(description=_('Add New Payment'))
     def add_new_sponsoring(modeladmin, request, queryset):
-        amount_of_sponsors_saved = 0
-        all_children = Child.objects.all()
-
-        for sponsor in queryset:
-            if not sponsor.active:
-                continue
-
-            children_of_sponsor = [c for c in all_children if sponsor in c.get_adoption_parents() and sponsor.active]
-            
-            for child in children_of_sponsor:
-                sp = AdoptionParentSponsoring(
-                    date=datetime.now(),
-                    amount=0, 
-                    parent=sponsor,
-                    child=child
-                )
+        created, skipped = payments.generate_yearly_payments(parents=queryset, user=request.user)
 
-                sp.save()
-                amount_of_sponsors_saved += 1
+        if created:
+            refresh_dashboard_snapshot.delay()
 
+        if skipped:
+            messages.info(request, _(f"Skipped {skipped} Payments that already exist this year."))
 
-        return messages.success(request, _(f"Added {amount_of_sponsors_saved} Payments!"))
+        return messages.success(request, _(f"Added {created} Payments!"))
 
     @action(description=_("Generate Address List"))
     def generate_address_list(modeladmin, request, queryset):
         return helper.generateAddressList(modeladmin, request, queryset)
 
+    @action(description=_("Generate Address Labels"))
+    def generate_address_labels(modeladmin, request, queryset):
+        return helper.generateAddressList(modeladmin, request, queryset, sheet="a4-3x8")
+
     @action(description=_("Generate Mailing List"))
     def generate_mail_list(modeladmin, request, queryset):
-        link = helper.generateMailList(modeladmin, request, queryset)
-        query_string = urlencode({'emails': link})
-        return HttpResponseRedirect(reverse('admin:generate_mailto_link') + '?' + query_string)
+        return helper.generateMailList(modeladmin, request, queryset)
+    
+    @action(description=_("Export as CSV"))
+    def export_csv(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'csv')
+
+    @action(description=_("Export as Excel"))
+    def export_xlsx(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'xlsx')
     
     @action(description=_("Mark as read"))
     def mark_as_read(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(AdoptionParent)
-        updated_count = 0
-
-        for obj in queryset:
-            # Update or create UserView entry
-            user_view, created = UserView.objects.update_or_create(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'last_viewed': timezone.now()}
-            )
-            if not created:
-                updated_count += 1
-
+        updated_count = read_state.mark_read(request.user, queryset)
         self.message_user(request, _(f"{updated_count} adoption parents were successfully marked as read."))
 
 
     @action(description=_("Mark as unread"))
     def mark_as_unread(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(AdoptionParent)
-        deleted_count = 0
-
-        for obj in queryset:
-            user_view_qs = UserView.objects.filter(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id
-            )
-            deleted_count += user_view_qs.count()
-            user_view_qs.delete()
-
+        deleted_count = read_state.mark_unread(request.user, queryset)
         self.message_user(request, _(f"{deleted_count} adoption parents were successfully marked as unread."))
     
 
-    @display(description=_lazy_('First Name'))
+    @display(description=_lazy_('First Name'), ordering='first_name')
     def changed_and_first_name(self, obj):
-        # Get content type for the model
-        content_type = ContentType.objects.get_for_model(AdoptionParent)
-
-        # Check if there's a UserView record for the object and user
-        user_view = UserView.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=obj.id
-        ).first()
-
-        # Determine if the object has been updated since last viewed
-        has_viewed = user_view is not None and obj.last_updated <= user_view.last_viewed
-
-        # Return HTML with a red dot if not viewed
-        red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
-        return format_html('<div class="flex items-center">{} <span>{}</span></div>'.format(red_dot if not has_viewed else '', obj.first_name))
+        return format_read_state(obj, obj.first_name)
     
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         response = super().change_view(request, object_id, form_url, extra_context)
 
         # Update the UserView record
-        content_type = ContentType.objects.get_for_model(AdoptionParent)
-        UserView.objects.update_or_create(
-            user=request.user,
-            content_type=content_type,
-            object_id=object_id,
-            defaults={'last_viewed': timezone.now()}
-        )
+        read_state.mark_viewed(request.user, AdoptionParent, object_id)
         return response
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.request = request  # Make the request available for instance methods
-        return qs
+        qs = super().get_queryset(request).prefetch_related(
+            Prefetch('adoption_set', queryset=Adoption.objects.select_related('child'))
+        )
+        return read_state.annotate_unread(qs, request.user)
     
 
 @admin.register(Child, site=saranalaya_admin_site)
-class ChildAdmin(SimpleHistoryAdmin, ModelAdmin):
+class ChildAdmin(FullTextSearchMixin, SimpleHistoryAdmin, ModelAdmin):
 
-    list_display = ('changed_and_name', 'status_colored', 'day_of_birth', 'get_adoption_parents_formatted')
+    list_display = ('changed_and_name', 'status_colored', 'day_of_birth', 'get_adoption_parents_formatted', 'amount_of_adoption_parents')
 
     @display(
         description=_lazy_('Status'), 
@@ -338,43 +371,27 @@ class ChildAdmin(SimpleHistoryAdmin, ModelAdmin):
     def status_colored(self, obj):
         return obj.status, obj.get_status_display()
     
-    @display(description=_lazy_('Name'))
+    @display(description=_lazy_('Name'), ordering='name')
     def changed_and_name(self, obj):
-        # Get content type for the model
-        content_type = ContentType.objects.get_for_model(Child)
-
-        # Check if there's a UserView record for the object and user
-        user_view = UserView.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=obj.id
-        ).first()
-
-        # Determine if the object has been updated since last viewed
-        has_viewed = user_view is not None and obj.last_updated <= user_view.last_viewed
-
-        # Return HTML with a red dot if not viewed
-        red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
-        return format_html('<div class="flex items-center">{} <span>{}</span></div>'.format(red_dot if not has_viewed else '', obj.name))
+        return format_read_state(obj, obj.name)
     
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         response = super().change_view(request, object_id, form_url, extra_context)
 
         # Update the UserView record
-        content_type = ContentType.objects.get_for_model(Child)
-        UserView.objects.update_or_create(
-            user=request.user,
-            content_type=content_type,
-            object_id=object_id,
-            defaults={'last_viewed': timezone.now()}
-        )
+        read_state.mark_viewed(request.user, Child, object_id)
         return response
     
+    @display(description=_lazy_('Amount of Adoption Parents'), ordering='adoption_parent_count')
+    def amount_of_adoption_parents(self, obj):
+        return obj.adoption_parent_count
+
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.request = request  # Make the request available for instance methods
-        return qs
+        qs = super().get_queryset(request).with_adoption_parent_count().prefetch_related(
+            Prefetch('adoption_set', queryset=Adoption.objects.select_related('adoptionparent'))
+        )
+        return read_state.annotate_unread(qs, request.user)
     
     
     ordering = ('name',)
@@ -384,6 +401,7 @@ class ChildAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     search_fields = ('name', 'gender', 'adoptionparent__first_name', 'adoptionparent__last_name', 'adoptionparent__firm', 'adoptionparent__street_name', 'adoptionparent__postcode', 'adoptionparent__city', 'adoptionparent__country', 'adoptionparent__mail', 'adoptionparent__description', 'adoptionparent__phone_number', 'day_of_birth', 'date_of_admission', 'date_of_leave', 'indian_parent_status', 'status', 'link_website', 'description')
     list_filter = (
+        ReadStatusFilter,
         AmountOfAdoptionParentsFilter,
         'gender',
         'status',
@@ -402,52 +420,31 @@ class ChildAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     @action(description=_("Mark as read"))
     def mark_as_read(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Child)
-        updated_count = 0
-
-        for obj in queryset:
-            # Update or create UserView entry
-            user_view, created = UserView.objects.update_or_create(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'last_viewed': timezone.now()}
-            )
-            if not created:
-                updated_count += 1
-
+        updated_count = read_state.mark_read(request.user, queryset)
         self.message_user(request, _(f"{updated_count} children were successfully marked as read."))
 
 
     @action(description=_("Mark as unread"))
     def mark_as_unread(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Child)
-        deleted_count = 0
-
-        for obj in queryset:
-            user_view_qs = UserView.objects.filter(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id
-            )
-            deleted_count += user_view_qs.count()
-            user_view_qs.delete()
-
+        deleted_count = read_state.mark_unread(request.user, queryset)
         self.message_user(request, _(f"{deleted_count} children were successfully marked as unread."))
 
 
 @admin.register(AdoptionParentSponsoring, site=saranalaya_admin_site)
-class AdoptionParentSponsoringAdmin(SimpleHistoryAdmin, ModelAdmin):
+class AdoptionParentSponsoringAdmin(FullTextSearchMixin, SimpleHistoryAdmin, ModelAdmin):
     class Media:
         js = ('js/paymentcolor.js',)   
 
     form = AdoptionSponsoringForm
 
-    list_display = ('changed_and_date', 'amount', 'parent', 'child', 'get_amount_left')
+    list_display = ('changed_and_date', 'amount', 'parent', 'child', 'get_amount_left', 'get_year_amount_left')
     ordering = ('-date', 'amount')
 
     search_fields = ('date', 'amount', 'description', 'parent__first_name', 'parent__last_name','parent__firm', 'parent__street_name', 'parent__postcode', 'parent__city', 'parent__country', 'parent__mail', 'parent__description', 'parent__phone_number', 'child__name')
     list_filter = (
+        ReadStatusFilter,
+        AmountLeftFilter,
+        ArrearsFilter,
         ('date', RangeDateFilter), 
         ('amount', RangeNumericFilter), 
         'parent', 'child'
@@ -457,9 +454,12 @@ class AdoptionParentSponsoringAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     actions = [
         "generate_address_list",
+        "generate_address_labels",
         "generate_mail_list",
         "mark_as_read",
-        "mark_as_unread"
+        "mark_as_unread",
+        "export_csv",
+        "export_xlsx",
     ]
 
     @action(description=_("Generate Address List"))
@@ -469,92 +469,67 @@ class AdoptionParentSponsoringAdmin(SimpleHistoryAdmin, ModelAdmin):
         parents = AdoptionParent.objects.filter(id__in=parent_queryset)
         return helper.generateAddressList(modeladmin, request, parents)
 
+    @action(description=_("Generate Address Labels"))
+    def generate_address_labels(modeladmin, request, queryset):
+        # queryset should only be the corresponding adoptionparents
+        parent_queryset = queryset.values_list('parent', flat=True).distinct()
+        parents = AdoptionParent.objects.filter(id__in=parent_queryset)
+        return helper.generateAddressList(modeladmin, request, parents, sheet="a4-3x8")
+
     @action(description=_("Generate Mailing List"))
     def generate_mail_list(modeladmin, request, queryset):
         # queryset should only be the corresponding adoptionparents
         parent_queryset = queryset.values_list('parent', flat=True).distinct()
         parents = AdoptionParent.objects.filter(id__in=parent_queryset)
-        link = helper.generateMailList(modeladmin, request, queryset)
-        query_string = urlencode({'emails': link})
-        return HttpResponseRedirect(reverse('admin:generate_mailto_link') + '?' + query_string)
+        return helper.generateMailList(modeladmin, request, parents)
+    
+    @action(description=_("Export as CSV"))
+    def export_csv(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'csv')
+
+    @action(description=_("Export as Excel"))
+    def export_xlsx(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'xlsx')
     
     @action(description=_("Mark as read"))
     def mark_as_read(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(AdoptionParentSponsoring)
-        updated_count = 0
-
-        for obj in queryset:
-            # Update or create UserView entry
-            user_view, created = UserView.objects.update_or_create(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'last_viewed': timezone.now()}
-            )
-            if not created:
-                updated_count += 1
-
+        updated_count = read_state.mark_read(request.user, queryset)
         self.message_user(request, _(f"{updated_count} payments were successfully marked as read."))
 
 
     @action(description=_("Mark as unread"))
     def mark_as_unread(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(AdoptionParentSponsoring)
-        deleted_count = 0
-
-        for obj in queryset:
-            user_view_qs = UserView.objects.filter(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id
-            )
-            deleted_count += user_view_qs.count()
-            user_view_qs.delete()
-
+        deleted_count = read_state.mark_unread(request.user, queryset)
         self.message_user(request, _(f"{deleted_count} payments were successfully marked as unread."))
 
-    @display(description=_lazy_('Date'))
+    @display(description=_lazy_('Date'), ordering='date')
     def changed_and_date(self, obj):
-        # Get content type for the model
-        content_type = ContentType.objects.get_for_model(AdoptionParentSponsoring)
-
-        # Check if there's a UserView record for the object and user
-        user_view = UserView.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=obj.id
-        ).first()
-
-        # Determine if the object has been updated since last viewed
-        has_viewed = user_view is not None and obj.last_updated <= user_view.last_viewed
-
-        # Return HTML with a red dot if not viewed
-        red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
-        return format_html('<div class="flex items-center">{} <span>{}</span></div>'.format(red_dot if not has_viewed else '', obj.date))
+        return format_read_state(obj, obj.date)
     
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         response = super().change_view(request, object_id, form_url, extra_context)
 
         # Update the UserView record
-        content_type = ContentType.objects.get_for_model(AdoptionParentSponsoring)
-        UserView.objects.update_or_create(
-            user=request.user,
-            content_type=content_type,
-            object_id=object_id,
-            defaults={'last_viewed': timezone.now()}
-        )
+        read_state.mark_viewed(request.user, AdoptionParentSponsoring, object_id)
         return response
+
+    @display(description=_lazy_('Amount remaining'), ordering='amount_left')
+    def get_amount_left(self, obj):
+        return format_amount_left(obj.amount_left)
+
+    @display(description=_lazy_('Remaining this year'), ordering='year_amount_left')
+    def get_year_amount_left(self, obj):
+        return format_amount_left(obj.year_amount_left)
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.request = request  # Make the request available for instance methods
-        return qs
+        qs = super().get_queryset(request).with_amount_left().with_arrears()
+        return read_state.annotate_unread(qs, request.user)
     
 
 @admin.register(Sponsor, site=saranalaya_admin_site)
 class SponsorAdmin(SimpleHistoryAdmin, ModelAdmin):
-    list_display = ('changed_and_first_name', 'last_name', 'letters')
+    list_display = ('changed_and_first_name', 'last_name', 'letters', 'donation_total', 'donations_this_year', 'last_donation_date', 'donation_count')
     ordering = ('first_name', 'last_name')
     inlines = [
         DonationInline
@@ -562,102 +537,89 @@ class SponsorAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     search_fields = ('first_name', 'last_name', 'firm', 'street_name', 'address_number', 'bus', 'postcode', 'city', 'country', 'mail', 'description', 'phone_number')
     list_filter = (
+        ReadStatusFilter,
         'letters', 
         'country', 
         ('city', FieldTextFilter),
+        DonationTotalFilter,
+        DonationsThisYearFilter,
+        DonationCountFilter,
     )
     list_filter_submit = True
 
     actions = [
         "generate_address_list",
+        "generate_address_labels",
         "generate_mail_list",
         "mark_as_read",
-        "mark_as_unread"
+        "mark_as_unread",
+        "export_csv",
+        "export_xlsx",
     ]
 
     @action(description=_("Generate Address List"))
     def generate_address_list(modeladmin, request, queryset):
         return helper.generateAddressList(modeladmin, request, queryset)
 
+    @action(description=_("Generate Address Labels"))
+    def generate_address_labels(modeladmin, request, queryset):
+        return helper.generateAddressList(modeladmin, request, queryset, sheet="a4-3x8")
+
     @action(description=_("Generate Mailing List"))
     def generate_mail_list(modeladmin, request, queryset):
-        link = helper.generateMailList(modeladmin, request, queryset)
-        query_string = urlencode({'emails': link})
-        return HttpResponseRedirect(reverse('admin:generate_mailto_link') + '?' + query_string)
+        return helper.generateMailList(modeladmin, request, queryset)
+    
+    @action(description=_("Export as CSV"))
+    def export_csv(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'csv')
+
+    @action(description=_("Export as Excel"))
+    def export_xlsx(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'xlsx')
     
     @action(description=_("Mark as read"))
     def mark_as_read(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Sponsor)
-        updated_count = 0
-
-        for obj in queryset:
-            # Update or create UserView entry
-            user_view, created = UserView.objects.update_or_create(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'last_viewed': timezone.now()}
-            )
-            if not created:
-                updated_count += 1
-
+        updated_count = read_state.mark_read(request.user, queryset)
         self.message_user(request, _(f"{updated_count} sponsors were successfully marked as read."))
 
 
     @action(description=_("Mark as unread"))
     def mark_as_unread(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Sponsor)
-        deleted_count = 0
-
-        for obj in queryset:
-            user_view_qs = UserView.objects.filter(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id
-            )
-            deleted_count += user_view_qs.count()
-            user_view_qs.delete()
-
+        deleted_count = read_state.mark_unread(request.user, queryset)
         self.message_user(request, _(f"{deleted_count} sponsors were successfully marked as unread."))
     
-    @display(description=_lazy_('First Name'))
+    @display(description=_lazy_('First Name'), ordering='first_name')
     def changed_and_first_name(self, obj):
-        # Get content type for the model
-        content_type = ContentType.objects.get_for_model(Sponsor)
-
-        # Check if there's a UserView record for the object and user
-        user_view = UserView.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=obj.id
-        ).first()
-
-        # Determine if the object has been updated since last viewed
-        has_viewed = user_view is not None and obj.last_updated <= user_view.last_viewed
-
-        # Return HTML with a red dot if not viewed
-        red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
-        return format_html('<div class="flex items-center">{} <span>{}</span></div>'.format(red_dot if not has_viewed else '', obj.first_name))
+        return format_read_state(obj, obj.first_name)
     
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         response = super().change_view(request, object_id, form_url, extra_context)
 
         # Update the UserView record
-        content_type = ContentType.objects.get_for_model(Sponsor)
-        UserView.objects.update_or_create(
-            user=request.user,
-            content_type=content_type,
-            object_id=object_id,
-            defaults={'last_viewed': timezone.now()}
-        )
+        read_state.mark_viewed(request.user, Sponsor, object_id)
         return response
+
+    @display(description=_lazy_('Total Donated'), ordering='donation_total')
+    def donation_total(self, obj):
+        return obj.donation_total
+
+    @display(description=_lazy_('Donated This Year'), ordering='donations_this_year')
+    def donations_this_year(self, obj):
+        return obj.donations_this_year
+
+    @display(description=_lazy_('Last Donation'), ordering='last_donation_date')
+    def last_donation_date(self, obj):
+        return obj.last_donation_date
+
+    @display(description=_lazy_('Amount of Donations'), ordering='donation_count')
+    def donation_count(self, obj):
+        return obj.donation_count
     
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.request = request  # Make the request available for instance methods
-        return qs
+        qs = super().get_queryset(request).with_donation_totals()
+        return read_state.annotate_unread(qs, request.user)
     
 
 @admin.register(Donation, site=saranalaya_admin_site)
@@ -666,6 +628,7 @@ class DonationAdmin(SimpleHistoryAdmin, ModelAdmin):
     ordering = ('-date', 'amount')
     search_fields = ('sponsor__first_name', 'sponsor__last_name', 'sponsor__firm', 'sponsor__street_name', 'sponsor__postcode', 'sponsor__city', 'sponsor__country', 'sponsor__mail', 'sponsor__description', 'sponsor__phone_number', 'amount', 'date', 'description')
     list_filter = (
+        ReadStatusFilter,
         ('date' , RangeDateFilter),
         ('amount', RangeNumericFilter),
         'sponsor'
@@ -674,82 +637,70 @@ class DonationAdmin(SimpleHistoryAdmin, ModelAdmin):
 
     actions = [
         "mark_as_read",
-        "mark_as_unread"
+        "mark_as_unread",
+        "export_csv",
+        "export_xlsx",
     ]
 
+    @action(description=_("Export as CSV"))
+    def export_csv(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'csv')
+
+    @action(description=_("Export as Excel"))
+    def export_xlsx(modeladmin, request, queryset):
+        return helper.generateExport(modeladmin, request, queryset, 'xlsx')
+    
     @action(description=_("Mark as read"))
     def mark_as_read(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Donation)
-        updated_count = 0
-
-        for obj in queryset:
-            # Update or create UserView entry
-            user_view, created = UserView.objects.update_or_create(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id,
-                defaults={'last_viewed': timezone.now()}
-            )
-            if not created:
-                updated_count += 1
-
+        updated_count = read_state.mark_read(request.user, queryset)
         self.message_user(request, _(f"{updated_count} donations were successfully marked as read."))
 
 
     @action(description=_("Mark as unread"))
     def mark_as_unread(self, request, queryset):
-        content_type = ContentType.objects.get_for_model(Donation)
-        deleted_count = 0
-
-        for obj in queryset:
-            user_view_qs = UserView.objects.filter(
-                user=request.user,
-                content_type=content_type,
-                object_id=obj.id
-            )
-            deleted_count += user_view_qs.count()
-            user_view_qs.delete()
-
+        deleted_count = read_state.mark_unread(request.user, queryset)
         self.message_user(request, _(f"{deleted_count} donations were successfully marked as unread."))
 
-    @display(description=_lazy_('Date'))
+    @display(description=_lazy_('Date'), ordering='date')
     def changed_and_date(self, obj):
-        # Get content type for the model
-        content_type = ContentType.objects.get_for_model(Donation)
-
-        # Check if there's a UserView record for the object and user
-        user_view = UserView.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=obj.id
-        ).first()
-
-        # Determine if the object has been updated since last viewed
-        has_viewed = user_view is not None and obj.last_updated <= user_view.last_viewed
-
-        # Return HTML with a red dot if not viewed
-        red_dot = '<div class="block mr-3 outline rounded-full ml-1 h-1 w-1 bg-red-500 outline-red-200 dark:outline-red-500/20"></div>'
-        return format_html('<div class="flex items-center">{} <span>{}</span></div>'.format(red_dot if not has_viewed else '', obj.date))
+        return format_read_state(obj, obj.date)
     
 
     def change_view(self, request, object_id, form_url='', extra_context=None):
         response = super().change_view(request, object_id, form_url, extra_context)
 
         # Update the UserView record
-        content_type = ContentType.objects.get_for_model(Donation)
-        UserView.objects.update_or_create(
-            user=request.user,
-            content_type=content_type,
-            object_id=object_id,
-            defaults={'last_viewed': timezone.now()}
-        )
+        read_state.mark_viewed(request.user, Donation, object_id)
         return response
     
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        self.request = request  # Make the request available for instance methods
-        return qs
+        return read_state.annotate_unread(qs, request.user)
+
+
+@admin.register(NotificationDigestRun, site=saranalaya_admin_site)
+class NotificationDigestRunAdmin(ModelAdmin):
+    list_display = ('started_at', 'duration', 'query_duration', 'amount_of_users', 'amount_of_mails', 'amount_of_mails_sent')
+    ordering = ('-started_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Configuration, site=saranalaya_admin_site)
+class ConfigurationAdmin(ModelAdmin):
+    list_display = ('__str__', 'amount_adoption_parents', 'organisation_name')
+
+    def has_add_permission(self, request):
+        # there is only one configuration
+        return not Configuration.objects.exists()
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # CELERY #
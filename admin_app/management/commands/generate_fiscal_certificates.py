@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from admin_app.utils import certificates
+
+
+class Command(BaseCommand):
+    help = "Generate the fiscal certificates of the donations of a year and store them as a zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            type=int,
+            default=date.today().year - 1,
+            help="Year of the donations, last year by default",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Amount of processes that render the certificates, the amount of CPUs by default",
+        )
+
+    def handle(self, *args, **options):
+        name, amount, per_second = certificates.generate(options["year"], workers=options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"{amount} certificates written to {name} ({per_second:.1f} certificates/s)"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from admin_app.utils import search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the search documents of the command palette from the adoption parents, children, sponsors, participants and payments"
+
+    def handle(self, *args, **options):
+        amount = search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{amount} search documents created"))
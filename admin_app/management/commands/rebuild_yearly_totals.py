@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_app.utils import yearly_totals
+
+
+class Command(BaseCommand):
+    help = "Rebuild the yearly totals from the donations and adoption parent payments, and verify them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only verify the stored yearly totals, don't rebuild them",
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            yearly_totals.rebuild()
+            self.stdout.write("Yearly totals rebuilt")
+
+        differences = yearly_totals.find_differences()
+        if differences:
+            for year, kind, supporter_id in differences:
+                self.stderr.write(f"Mismatch for year {year}, kind {kind}, supporter {supporter_id}")
+            raise CommandError(f"{len(differences)} yearly totals don't match the raw tables")
+
+        self.stdout.write(self.style.SUCCESS("Yearly totals match the raw tables"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_app.models import AdoptionParent, AdoptionParentSponsoring, Child
+from admin_app.utils import search
+
+
+class Command(BaseCommand):
+    help = "Recompute the full text search vectors of the adoption parents, children and payments"
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError("Full text search needs a PostgreSQL database")
+
+        for model in (AdoptionParent, Child, AdoptionParentSponsoring):
+            updated = search.update_search_vectors(model)
+            self.stdout.write(f"{updated} {model._meta.verbose_name_plural} updated")
+
+        self.stdout.write(self.style.SUCCESS("Search vectors are up to date"))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_yearly_totals(apps, schema_editor):
+    YearlyTotal = apps.get_model('admin_app', 'YearlyTotal')
+    sources = [
+        (apps.get_model('admin_app', 'Donation'), 'd', 'sponsor_id'),
+        (apps.get_model('admin_app', 'AdoptionParentSponsoring'), 'p', 'parent_id'),
+    ]
+
+    for model, kind, supporter_field in sources:
+        rows = model.objects.order_by().values_list('date__year', supporter_field).annotate(Sum('amount'), Count('pk'))
+        YearlyTotal.objects.bulk_create([
+            YearlyTotal(year=year, kind=kind, supporter_id=supporter_id, amount=amount, count=count)
+            for year, supporter_id, amount, count in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0008_sponsor_letters_adoption_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YearlyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='Year')),
+                ('kind', models.CharField(choices=[('d', 'Donation'), ('p', 'Adoption Parent Payment')], max_length=1, verbose_name='Kind')),
+                ('supporter_id', models.PositiveIntegerField(verbose_name='Supporter')),
+                ('amount', models.FloatField(default=0, verbose_name='Amount')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+            ],
+            options={
+                'verbose_name': 'Yearly Total',
+                'verbose_name_plural': 'Yearly Totals',
+                'unique_together': {('year', 'kind', 'supporter_id')},
+            },
+        ),
+        migrations.RunPython(fill_yearly_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0009_yearlytotal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigestRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Started At')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration (s)')),
+                ('query_duration', models.FloatField(default=0, verbose_name='Query Duration (s)')),
+                ('amount_of_users', models.PositiveIntegerField(default=0, verbose_name='Users')),
+                ('amount_of_mails', models.PositiveIntegerField(default=0, verbose_name='Mails')),
+                ('amount_of_mails_sent', models.PositiveIntegerField(default=0, verbose_name='Mails Sent')),
+            ],
+            options={
+                'verbose_name': 'Notification Digest Run',
+                'verbose_name_plural': 'Notification Digest Runs',
+                'ordering': ['-started_at'],
+                'get_latest_by': 'started_at',
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, Min, OuterRef, Q
+from django.utils import timezone
+
+
+TRACKED_MODELS = ('child', 'adoptionparent', 'adoptionparentsponsoring', 'sponsor', 'donation')
+
+
+def compact_user_views(apps, schema_editor):
+    # turn the UserView row of every viewed object into a watermark per user and model,
+    # only the rows that the watermark can't express are kept
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    UserView = apps.get_model('admin_app', 'UserView')
+    ReadWatermark = apps.get_model('admin_app', 'ReadWatermark')
+    now = timezone.now()
+
+    for content_type in ContentType.objects.filter(app_label='admin_app', model__in=TRACKED_MODELS):
+        model = apps.get_model('admin_app', content_type.model)
+        user_ids = UserView.objects.filter(content_type=content_type).order_by().values_list('user_id', flat=True).distinct()
+
+        for user_id in list(user_ids):
+            user_views = UserView.objects.filter(user_id=user_id, content_type=content_type)
+
+            # everything older than the oldest object the user never opened has been seen
+            oldest_unread = model.objects.filter(
+                ~Exists(user_views.filter(object_id=OuterRef('pk'))),
+            ).aggregate(oldest=Min('last_updated'))['oldest']
+            seen_until = min(oldest_unread, now) if oldest_unread is not None else now
+            ReadWatermark.objects.create(user_id=user_id, content_type=content_type, seen_until=seen_until)
+
+            objects = model.objects.filter(pk=OuterRef('object_id'))
+            user_views.filter(
+                Q(Exists(objects.filter(last_updated__lt=seen_until, last_updated__lte=OuterRef('last_viewed'))))
+                | Q(Exists(objects.filter(last_updated__gte=seen_until, last_updated__gt=OuterRef('last_viewed'))))
+                | ~Q(Exists(objects))
+            ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0010_notificationdigestrun'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userview',
+            name='last_viewed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seen_until', models.DateTimeField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'content_type')},
+            },
+        ),
+        migrations.RunPython(compact_user_views, migrations.RunPython.noop),
+    ]
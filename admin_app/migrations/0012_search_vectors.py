@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce, Concat
+
+
+# the search fields as they were when the vectors were added, see utils/search.py
+SEARCH_FIELDS = {
+    'adoptionparent': {
+        'A': ('first_name', 'last_name', 'firm'),
+        'B': ('mail', 'phone_number', 'street_name', 'address_number', 'bus', 'postcode', 'city', 'country', 'children__name'),
+        'C': ('description', 'children__description'),
+    },
+    'child': {
+        'A': ('name',),
+        'B': (
+            'adoptionparent__first_name', 'adoptionparent__last_name', 'adoptionparent__firm', 'adoptionparent__mail',
+            'adoptionparent__phone_number', 'adoptionparent__street_name', 'adoptionparent__postcode',
+            'adoptionparent__city', 'adoptionparent__country',
+        ),
+        'C': ('description', 'link_website', 'adoptionparent__description'),
+    },
+    'adoptionparentsponsoring': {
+        'A': ('parent__first_name', 'parent__last_name', 'parent__firm', 'child__name'),
+        'B': (
+            'date', 'amount', 'parent__mail', 'parent__phone_number', 'parent__street_name', 'parent__postcode',
+            'parent__city', 'parent__country',
+        ),
+        'C': ('description', 'parent__description'),
+    },
+}
+
+
+def joined_text(model, fields):
+    parts = []
+    for field in fields:
+        parts += [field, models.Value(' ')]
+    text = Concat(*parts[:-1], output_field=models.TextField()) if len(fields) > 1 else Cast(fields[0], models.TextField())
+
+    return Coalesce(
+        models.Subquery(
+            model._default_manager.filter(pk=models.OuterRef('pk')).order_by().values('pk')
+            .annotate(text=StringAgg(text, ' '))
+            .values('text')
+        ),
+        models.Value(''),
+        output_field=models.TextField(),
+    )
+
+
+def get_vector(model):
+    vector = None
+    for weight, fields in SEARCH_FIELDS[model._meta.model_name].items():
+        local_fields = [field for field in fields if '__' not in field]
+        joined_fields = [field for field in fields if '__' in field]
+
+        expressions = local_fields + ([joined_text(model, joined_fields)] if joined_fields else [])
+        weighted = SearchVector(*expressions, weight=weight, config='simple')
+        vector = weighted if vector is None else vector + weighted
+
+    return vector
+
+
+def fill_search_vectors(apps, schema_editor):
+    # the signals keep the vectors up to date from now on
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for model_name in ('AdoptionParent', 'Child', 'AdoptionParentSponsoring'):
+        model = apps.get_model('admin_app', model_name)
+        model._default_manager.update(search_vector=get_vector(model))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0011_readwatermark'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='adoptionparent',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='adoptionparentsponsoring',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='child',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='adoptionparent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='adoptionparent_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='adoptionparent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['first_name'], name='adoptionparent_first_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='adoptionparent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['last_name'], name='adoptionparent_last_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='adoptionparentsponsoring',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='payment_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='child',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='child_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='child',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='child_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
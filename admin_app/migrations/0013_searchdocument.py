@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# the indexed models and the document fields as they were when the documents were added,
+# see utils/search_index.py
+INDEXED_MODELS = ('admin_app.Child', 'admin_app.AdoptionParent', 'admin_app.Sponsor', 'events.Participant', 'events.Payment')
+
+
+def normalize(value):
+    return " ".join((value or "").lower().split())
+
+
+def get_document_fields(instance):
+    if instance._meta.model_name == 'child':
+        names = [instance.name]
+    else:
+        names = [instance.first_name or "", instance.last_name or ""]
+
+    mail = getattr(instance, 'mail', None) or ""
+    details = [str(instance._meta.verbose_name), mail, getattr(instance, 'city', None) or ""]
+
+    return {
+        'title': (" ".join(name for name in names if name) or mail or str(instance.pk))[:200],
+        'description': " · ".join(detail for detail in details if detail)[:200],
+        'name': normalize(" ".join(names))[:110],
+        'reversed_name': normalize(" ".join(reversed(names)))[:110],
+        'mail': normalize(mail)[:254],
+        'postcode': normalize(getattr(instance, 'postcode', None))[:15],
+    }
+
+
+def fill_search_documents(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    SearchDocument = apps.get_model('admin_app', 'SearchDocument')
+
+    for label in INDEXED_MODELS:
+        model = apps.get_model(label)
+        content_type, _ = ContentType.objects.get_or_create(app_label=model._meta.app_label, model=model._meta.model_name)
+        SearchDocument.objects.bulk_create((
+            SearchDocument(content_type=content_type, object_id=instance.pk, **get_document_fields(instance))
+            for instance in model.objects.iterator(chunk_size=2000)
+        ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0012_search_vectors'),
+        ('events', '0017_alter_event_titel_sub_and_more'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=200, verbose_name='Title')),
+                ('description', models.CharField(blank=True, max_length=200, verbose_name='Description')),
+                ('name', models.CharField(blank=True, max_length=110, verbose_name='Name')),
+                ('reversed_name', models.CharField(blank=True, max_length=110, verbose_name='Reversed Name')),
+                ('mail', models.CharField(blank=True, max_length=254, verbose_name='E-mail')),
+                ('postcode', models.CharField(blank=True, max_length=15, verbose_name='Postcode')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Search Document',
+                'verbose_name_plural': 'Search Documents',
+                'indexes': [models.Index(fields=['name'], name='searchdocument_name', opclasses=['varchar_pattern_ops']), models.Index(fields=['reversed_name'], name='searchdocument_reversed_name', opclasses=['varchar_pattern_ops']), models.Index(fields=['mail'], name='searchdocument_mail', opclasses=['varchar_pattern_ops']), models.Index(fields=['postcode'], name='searchdocument_postcode', opclasses=['varchar_pattern_ops'])],
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+    ]
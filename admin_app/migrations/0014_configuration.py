@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+import admin_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0013_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Configuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_adoption_parents', models.FloatField(default=admin_app.models.default_amount_adoption_parents, verbose_name='Yearly amount per adoption')),
+            ],
+            options={
+                'verbose_name': 'Configuration',
+                'verbose_name_plural': 'Configuration',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0014_configuration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuration',
+            name='organisation_address',
+            field=models.TextField(blank=True, verbose_name='Organisation Address'),
+        ),
+        migrations.AddField(
+            model_name='configuration',
+            name='organisation_name',
+            field=models.CharField(default='Saranalaya', max_length=100, verbose_name='Organisation Name'),
+        ),
+        migrations.AddField(
+            model_name='configuration',
+            name='organisation_number',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Organisation Number'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+def get_letters_field():
+    field = models.BooleanField(default=True, verbose_name='Letters')
+    field.set_attributes_from_name('letters')
+    return field
+
+
+def has_letters_column(schema_editor, model):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(cursor, model._meta.db_table)
+
+    return any(column.name == 'letters' for column in columns)
+
+
+def add_letters_column(apps, schema_editor):
+    # the column was added to the sponsors without a migration in this history,
+    # databases that already have it keep it as it is
+    model = apps.get_model('admin_app', 'Sponsor')
+    if not has_letters_column(schema_editor, model):
+        schema_editor.add_field(model, get_letters_field())
+
+
+def remove_letters_column(apps, schema_editor):
+    model = apps.get_model('admin_app', 'Sponsor')
+    if has_letters_column(schema_editor, model):
+        schema_editor.remove_field(model, get_letters_field())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_app', '0015_configuration_organisation'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_letters_column, remove_letters_column),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='sponsor',
+                    name='letters',
+                    field=models.BooleanField(default=True, verbose_name='Letters'),
+                ),
+            ],
+        ),
+    ]
@@ -1,14 +1,18 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, ExtractYear, Greatest
 from django.contrib import admin
 from django.utils.html import format_html
 from django.shortcuts import resolve_url
 from django.contrib.admin.templatetags.admin_urls import admin_urlname
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.translation import gettext_lazy as _
 from simple_history.models import HistoricalRecords
 from django.urls import path
-from .views import generate_mailto_link
+from .views import download_mailing_list, generate_mailto_link, mailing_list_batch
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
@@ -16,6 +20,7 @@ from unfold.admin import ModelAdmin
 from .sites import saranalaya_admin_site
 
 import os
+from datetime import date
 
 
 # Unfold model admin
@@ -30,7 +35,9 @@ class UserAdmin(BaseUserAdmin, ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('generate_mailto_link/', generate_mailto_link, name='generate_mailto_link'),
+            path('generate_mailto_link/<str:token>/', self.admin_site.admin_view(generate_mailto_link), name='generate_mailto_link'),
+            path('generate_mailto_link/<str:token>/<int:batch>/', self.admin_site.admin_view(mailing_list_batch), name='mailing_list_batch'),
+            path('generate_mailto_link/<str:token>/download/<str:file_format>/', self.admin_site.admin_view(download_mailing_list), name='download_mailing_list'),
         ]
         return custom_urls + urls
 
@@ -58,6 +65,67 @@ class StatusChoices(models.TextChoices):
     SUPPORT = 's', _('Support')
 
 
+class YearlyTotalKindChoices(models.TextChoices):
+    DONATION = 'd', _('Donation')
+    ADOPTION_PARENT_PAYMENT = 'p', _('Adoption Parent Payment')
+
+
+
+# QUERYSETS #
+
+class ChildQuerySet(models.QuerySet):
+
+    def with_adoption_parent_count(self):
+        return self.annotate(adoption_parent_count=models.Count('adoptionparent', distinct=True))
+
+
+class SponsorQuerySet(models.QuerySet):
+
+    def with_donation_totals(self):
+        # read from the yearly totals, so the sums don't need every single donation
+        year = date.today().year
+        totals = YearlyTotal.objects.filter(
+            kind=YearlyTotalKindChoices.DONATION, supporter_id=models.OuterRef('pk'),
+        ).order_by().values('supporter_id')
+
+        def total(queryset, field):
+            return Coalesce(models.Subquery(queryset.annotate(total=models.Sum(field)).values('total')), 0, output_field=models.FloatField())
+
+        return self.annotate(
+            donation_total=total(totals, 'amount'),
+            donations_this_year=total(totals.filter(year=year), 'amount'),
+            donation_count=Coalesce(models.Subquery(totals.annotate(total=models.Sum('count')).values('total')), 0),
+            last_donation_date=models.Subquery(
+                Donation.objects.filter(sponsor=models.OuterRef('pk')).order_by('-date').values('date')[:1]
+            ),
+        )
+
+
+class AdoptionParentSponsoringQuerySet(models.QuerySet):
+
+    def with_amount_left(self):
+        amount = Configuration.get().amount_adoption_parents
+        return self.annotate(amount_left=Greatest(models.Value(amount) - models.F('amount'), models.Value(0.0)))
+
+    def with_arrears(self):
+        # what was paid and is still missing for the adoption in the year of the payment,
+        # summed over all payments of that parent, child and year, whatever else is filtered
+        amount = Configuration.get().amount_adoption_parents
+        year_payments = AdoptionParentSponsoring.objects.filter(
+            parent=models.OuterRef('parent'),
+            child=models.OuterRef('child'),
+            date__year=ExtractYear(models.OuterRef('date')),
+        ).order_by().values('parent')
+        year_amount = Coalesce(
+            models.Subquery(year_payments.annotate(total=models.Sum('amount')).values('total')),
+            0, output_field=models.FloatField(),
+        )
+        return self.annotate(
+            year_amount=year_amount,
+            year_amount_left=Greatest(models.Value(amount) - models.F('year_amount'), models.Value(0.0)),
+        )
+
+
 
 # MODELS #
 
@@ -66,6 +134,10 @@ class Child(models.Model):
         verbose_name = _("Child")
         verbose_name_plural = _("Children")
         ordering = ["name", "day_of_birth"]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="child_search_vector"),
+            GinIndex(fields=["name"], opclasses=["gin_trgm_ops"], name="child_name_trgm"),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -73,7 +145,8 @@ class Child(models.Model):
     @admin.display(description=_('Adoption Parents'))
     def get_adoption_parents_formatted(self):
         formatted_list = []
-        for adoption in Adoption.objects.filter(child_id=self.pk):
+        # uses the prefetched adoptions (with their parent) of the changelist when available
+        for adoption in self.adoption_set.all():
             if not adoption.adoptionparent.active: continue
 
             url = resolve_url(admin_urlname(AdoptionParent._meta, 'change'), adoption.adoptionparent.id)
@@ -97,8 +170,12 @@ class Child(models.Model):
     link_website = models.URLField(blank=True, null=True, verbose_name=_("Link website"))
     description = models.TextField(blank=True, null=True, verbose_name=_("Description"))
     last_updated = models.DateTimeField(auto_now=True)
+    # maintained by the signals in signals.py, see utils/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    history = HistoricalRecords(verbose_name=_("History"))
+    history = HistoricalRecords(verbose_name=_("History"), excluded_fields=["search_vector"])
+
+    objects = ChildQuerySet.as_manager()
 
 
 class Supporter(models.Model):
@@ -130,11 +207,17 @@ class AdoptionParent(Supporter):
     class Meta(Supporter.Meta):
         verbose_name = _("Adoption Parent")
         verbose_name_plural = _("Adoption Parents")
+        indexes = [
+            GinIndex(fields=["search_vector"], name="adoptionparent_search_vector"),
+            GinIndex(fields=["first_name"], opclasses=["gin_trgm_ops"], name="adoptionparent_first_name_trgm"),
+            GinIndex(fields=["last_name"], opclasses=["gin_trgm_ops"], name="adoptionparent_last_name_trgm"),
+        ]
 
     @admin.display(description=_('Children'))
     def get_children(self):
         formatted_list = []
-        for adoption in Adoption.objects.filter(adoptionparent_id=self.pk):
+        # uses the prefetched adoptions (with their child) of the changelist when available
+        for adoption in self.adoption_set.all():
             url = resolve_url(admin_urlname(Child._meta, 'change'), adoption.child.id)
             formatted_list.append(format_html(
                 f'<a class="{"bg-red-100 text-red-700 dark:bg-red-500/20 dark:text-red-400 leading-normal py-1 px-1 rounded" if not adoption.active else ""}"href="{url}">{str(adoption.child.name)}</a>'
@@ -145,8 +228,10 @@ class AdoptionParent(Supporter):
 
     children = models.ManyToManyField("Child", through="Adoption", blank=True, verbose_name=_("Children"))
     active = models.BooleanField(default=True, verbose_name=_("Active"))
+    # maintained by the signals in signals.py, see utils/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    history = HistoricalRecords(verbose_name=_("History"))
+    history = HistoricalRecords(verbose_name=_("History"), excluded_fields=["search_vector"])
 
 
 class Adoption(models.Model):
@@ -161,18 +246,30 @@ class AdoptionParentSponsoring(models.Model):
         verbose_name = _("Adoption Parent Payment")
         verbose_name_plural = _("Adoption Parent Payments")
         get_latest_by = "date"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="payment_search_vector"),
+        ]
 
     def __str__(self) -> str:
-        return str(self.parent) + f" ({str(self.date)})" + " - " + str(self.amount) + "/186"
+        return str(self.parent) + f" ({str(self.date)})" + " - " + str(self.amount) + f"/{Configuration.get().amount_adoption_parents:g}"
 
     @property
     @admin.display(description=_("Amount remaining"))
     def get_amount_left(self):
-        return max(0, float(os.environ.get("AMOUNT_ADOPTION_PARENTS")) - self.amount)
+        # annotated by with_amount_left() in the changelist
+        if hasattr(self, 'amount_left'):
+            return self.amount_left
+
+        return max(0, Configuration.get().amount_adoption_parents - self.amount)
     
 
     def is_enough(self):
-        return int(os.environ.get("AMOUNT_ADOPTION_PARENTS")) <= self.amount
+        return Configuration.get().amount_adoption_parents <= self.amount
+
+    def save(self, *args, **kwargs):
+        # the yearly totals are updated by signals, keep them in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     date = models.DateField(verbose_name=_("Date"))
     amount = models.FloatField(verbose_name=_("Amount"))
@@ -180,8 +277,12 @@ class AdoptionParentSponsoring(models.Model):
     parent = models.ForeignKey(AdoptionParent, on_delete=models.RESTRICT, verbose_name=_("Parent"))
     child = models.ForeignKey(Child, on_delete=models.RESTRICT, verbose_name=_("Child"))
     last_updated = models.DateTimeField(auto_now=True)
+    # maintained by the signals in signals.py, see utils/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
-    history = HistoricalRecords(verbose_name=_("History"))
+    history = HistoricalRecords(verbose_name=_("History"), excluded_fields=["search_vector"])
+
+    objects = AdoptionParentSponsoringQuerySet.as_manager()
 
     
 class Sponsor(Supporter):
@@ -193,6 +294,8 @@ class Sponsor(Supporter):
     
     history = HistoricalRecords(verbose_name=_("History"))
 
+    objects = SponsorQuerySet.as_manager()
+
 
 class Donation(models.Model):
     class Meta:
@@ -202,6 +305,11 @@ class Donation(models.Model):
     def __str__(self) -> str:
         return str(self.sponsor) + f" ({str(self.date)})" + ' - ' + str(self.amount)
 
+    def save(self, *args, **kwargs):
+        # the yearly totals are updated by signals, keep them in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     sponsor = models.ForeignKey(Sponsor, on_delete=models.RESTRICT, verbose_name=_("Sponsor"))
     amount = models.FloatField(verbose_name=_("Amount"))
     date = models.DateField(verbose_name=_("Date"))
@@ -211,12 +319,125 @@ class Donation(models.Model):
     history = HistoricalRecords(verbose_name=_("History"))
 
 
+# Objects whose read state differs from what the ReadWatermark of the user says,
+# last_viewed is empty for objects that were explicitly marked as unread
 class UserView(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
-    last_viewed = models.DateTimeField(auto_now=True)
+    last_viewed = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('user', 'content_type', 'object_id')
\ No newline at end of file
+        unique_together = ('user', 'content_type', 'object_id')
+
+
+# The user has seen every object of the model that was last updated before seen_until,
+# except for the ones with a UserView row
+class ReadWatermark(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    seen_until = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'content_type')
+
+
+# Sum and amount of donations or adoption parent payments per supporter and year,
+# maintained by the signals in signals.py
+class YearlyTotal(models.Model):
+    class Meta:
+        verbose_name = _("Yearly Total")
+        verbose_name_plural = _("Yearly Totals")
+        unique_together = ('year', 'kind', 'supporter_id')
+
+    year = models.IntegerField(verbose_name=_("Year"))
+    kind = models.CharField(max_length=1, choices=YearlyTotalKindChoices.choices, verbose_name=_("Kind"))
+    # sponsor for donations, adoption parent for adoption parent payments
+    supporter_id = models.PositiveIntegerField(verbose_name=_("Supporter"))
+    amount = models.FloatField(default=0, verbose_name=_("Amount"))
+    count = models.PositiveIntegerField(default=0, verbose_name=_("Count"))
+
+
+class NotificationDigestRun(models.Model):
+    class Meta:
+        verbose_name = _("Notification Digest Run")
+        verbose_name_plural = _("Notification Digest Runs")
+        ordering = ["-started_at"]
+        get_latest_by = "started_at"
+
+    def __str__(self) -> str:
+        return str(self.started_at)
+
+    started_at = models.DateTimeField(verbose_name=_("Started At"))
+    duration = models.FloatField(default=0, verbose_name=_("Duration (s)"))
+    query_duration = models.FloatField(default=0, verbose_name=_("Query Duration (s)"))
+    amount_of_users = models.PositiveIntegerField(default=0, verbose_name=_("Users"))
+    amount_of_mails = models.PositiveIntegerField(default=0, verbose_name=_("Mails"))
+    amount_of_mails_sent = models.PositiveIntegerField(default=0, verbose_name=_("Mails Sent"))
+
+
+# One row per person-like object of admin_app and events, for the search of the command palette.
+# Maintained by the signals in signals.py, the values are lowercased so they can be prefix matched
+class SearchDocument(models.Model):
+    class Meta:
+        verbose_name = _("Search Document")
+        verbose_name_plural = _("Search Documents")
+        unique_together = ('content_type', 'object_id')
+        indexes = [
+            models.Index(fields=["name"], opclasses=["varchar_pattern_ops"], name="searchdocument_name"),
+            models.Index(fields=["reversed_name"], opclasses=["varchar_pattern_ops"], name="searchdocument_reversed_name"),
+            models.Index(fields=["mail"], opclasses=["varchar_pattern_ops"], name="searchdocument_mail"),
+            models.Index(fields=["postcode"], opclasses=["varchar_pattern_ops"], name="searchdocument_postcode"),
+        ]
+
+    def __str__(self) -> str:
+        return self.title
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    title = models.CharField(max_length=200, verbose_name=_("Title"))
+    description = models.CharField(max_length=200, blank=True, verbose_name=_("Description"))
+    # "first last" and "last first", so both orders can be typed
+    name = models.CharField(max_length=110, blank=True, verbose_name=_("Name"))
+    reversed_name = models.CharField(max_length=110, blank=True, verbose_name=_("Reversed Name"))
+    mail = models.CharField(max_length=254, blank=True, verbose_name=_("E-mail"))
+    postcode = models.CharField(max_length=15, blank=True, verbose_name=_("Postcode"))
+
+
+def default_amount_adoption_parents():
+    return float(os.environ.get("AMOUNT_ADOPTION_PARENTS", 186))
+
+
+# Settings that can be changed in the admin, there is only one row. Use Configuration.get(), it is cached
+class Configuration(models.Model):
+    class Meta:
+        verbose_name = _("Configuration")
+        verbose_name_plural = _("Configuration")
+
+    def __str__(self) -> str:
+        return str(_("Configuration"))
+
+    def save(self, *args, **kwargs):
+        self.pk = 1
+        super().save(*args, **kwargs)
+        transaction.on_commit(lambda: cache.delete("configuration"))
+
+    @classmethod
+    def get(cls):
+        configuration = cache.get("configuration")
+        if configuration is None:
+            configuration, _created = cls.objects.get_or_create(pk=1)
+            cache.set("configuration", configuration, timeout=None)
+
+        return configuration
+
+    amount_adoption_parents = models.FloatField(
+        default=default_amount_adoption_parents,
+        verbose_name=_("Yearly amount per adoption"),
+    )
+    # shown on the fiscal certificates of the donations
+    organisation_name = models.CharField(max_length=100, default="Saranalaya", verbose_name=_("Organisation Name"))
+    organisation_number = models.CharField(max_length=20, blank=True, verbose_name=_("Organisation Number"))
+    organisation_address = models.TextField(blank=True, verbose_name=_("Organisation Address"))
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from events.models import Participant, Payment
+
+from .models import Adoption, AdoptionParent, AdoptionParentSponsoring, Child, Donation, Sponsor
+from .utils import badges, search, search_index, snapshot, yearly_totals
+
+
+@receiver([post_save, post_delete], sender=Donation)
+@receiver([post_save, post_delete], sender=AdoptionParentSponsoring)
+@receiver([post_save, post_delete], sender=Child)
+@receiver([post_save, post_delete], sender=AdoptionParent)
+def invalidate_dashboard(sender, **kwargs):
+    # only after commit, otherwise a recompute could still see the old data
+    transaction.on_commit(lambda: snapshot.invalidate("dashboard"))
+
+
+@receiver([post_save, post_delete], sender=Donation)
+@receiver([post_save, post_delete], sender=Sponsor)
+@receiver([post_save, post_delete], sender=AdoptionParentSponsoring)
+@receiver([post_save, post_delete], sender=AdoptionParent)
+@receiver([post_save, post_delete], sender=Child)
+def update_badges(sender, **kwargs):
+    # every changed object is unread for everyone, the open badge streams get the new counts
+    transaction.on_commit(badges.changed)
+
+
+@receiver(pre_save, sender=Donation)
+@receiver(pre_save, sender=AdoptionParentSponsoring)
+def remember_yearly_total(sender, instance, raw=False, **kwargs):
+    # the previous version is needed to move the amount out of its old yearly total
+    instance._yearly_total_old = None
+    if raw or instance.pk is None:
+        return
+
+    old = sender.objects.select_for_update().filter(pk=instance.pk).first()
+    if old is not None:
+        instance._yearly_total_old = (yearly_totals.get_instance_key(old), old.amount)
+
+
+@receiver(post_save, sender=Donation)
+@receiver(post_save, sender=AdoptionParentSponsoring)
+def update_yearly_total(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    key = yearly_totals.get_instance_key(instance)
+    old = getattr(instance, '_yearly_total_old', None)
+
+    if old is None:
+        yearly_totals.apply_change(key, instance.amount, 1)
+    elif old[0] == key:
+        if old[1] != instance.amount:
+            yearly_totals.apply_change(key, instance.amount - old[1], 0)
+    else:
+        yearly_totals.apply_change(old[0], -old[1], -1)
+        yearly_totals.apply_change(key, instance.amount, 1)
+
+
+@receiver(post_delete, sender=Donation)
+@receiver(post_delete, sender=AdoptionParentSponsoring)
+def remove_from_yearly_total(sender, instance, **kwargs):
+    yearly_totals.apply_change(yearly_totals.get_instance_key(instance), -instance.amount, -1)
+
+
+@receiver(post_save, sender=AdoptionParentSponsoring)
+@receiver([post_save, post_delete], sender=Adoption)
+@receiver(post_save, sender=Child)
+@receiver(post_save, sender=AdoptionParent)
+def update_search_vector(sender, instance, raw=False, **kwargs):
+    # with an update, so last_updated and the history stay untouched
+    if raw:
+        return
+
+    search.update_related_search_vectors(instance)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Participant)
+@receiver(post_save, sender=Sponsor)
+@receiver(post_save, sender=AdoptionParent)
+@receiver(post_save, sender=Child)
+def update_search_document(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    search_index.update_document(instance)
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=Sponsor)
+@receiver(post_delete, sender=AdoptionParent)
+@receiver(post_delete, sender=Child)
+def delete_search_document(sender, instance, **kwargs):
+    search_index.delete_document(instance)
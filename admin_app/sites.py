@@ -1,7 +1,16 @@
+from django.urls import path
 from unfold.sites import UnfoldAdminSite
 
 class SaranalayaAdminSite(UnfoldAdminSite):
-    pass
 
+    def get_urls(self):
+        from .views import badge_stream, download_certificates, download_export
 
-saranalaya_admin_site = SaranalayaAdminSite()
\ No newline at end of file
+        return [
+            path('badges/stream/', badge_stream, name='badge_stream'),
+            path('exports/<str:token>/', self.admin_view(download_export), name='download_export'),
+            path('certificates/<int:year>/', self.admin_view(download_certificates), name='download_certificates'),
+        ] + super().get_urls()
+
+
+saranalaya_admin_site = SaranalayaAdminSite()
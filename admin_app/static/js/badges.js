@@ -0,0 +1,33 @@
+document.addEventListener("DOMContentLoaded", function(event) {
+
+    // live unread counts in the sidebar, pushed by the server when something changes
+    var links = document.querySelectorAll('a[href^="/admin/admin_app/"]');
+    if (!links.length || !window.EventSource) {
+        return;
+    }
+
+    var source = new EventSource("/admin/badges/stream/");
+
+    source.addEventListener("badges", function(event) {
+        var counts = JSON.parse(event.data);
+
+        Object.keys(counts).forEach(model => {
+            var link = document.querySelector(`a[href="/admin/admin_app/${model}/"]`);
+            if (link === null) {
+                return;
+            }
+
+            // the badge of app_list_badge.html, made here if the page was rendered without one
+            var badge = link.querySelector("[data-badge]");
+            if (badge === null) {
+                badge = document.createElement("span");
+                badge.dataset.badge = "";
+                badge.className = "font-semibold h-[18px] leading-[18px] ml-2 px-1 relative rounded-xs text-center text-[11px] whitespace-nowrap uppercase min-w-[18px] bg-red-100 text-red-700 dark:bg-red-500/20 dark:text-red-400";
+                link.appendChild(badge);
+            }
+
+            badge.textContent = counts[model] > 0 ? counts[model] : "";
+            badge.hidden = !(counts[model] > 0);
+        })
+    });
+});
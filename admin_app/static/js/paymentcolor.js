@@ -1,15 +1,18 @@
 document.addEventListener("DOMContentLoaded", function(event) { 
     
-    // background color of amount left field
-    var allFields = document.querySelectorAll(".field-get_amount_left");
+    // background color of amount left fields, the yearly amount comes from the configuration
+    var allFields = document.querySelectorAll(".field-get_amount_left, .field-get_year_amount_left");
     var allFieldsArr = [...allFields];
 
     allFieldsArr.forEach(field => {
-        var innerValue = parseFloat(field.innerHTML)
-        percent = (innerValue /186) * 100
+        var value = field.querySelector("[data-amount-left]")
+        if (value === null) {
+            return
+        }
+
+        var percent = (parseFloat(value.dataset.amountLeft) / parseFloat(value.dataset.amount)) * 100
         field.style.backgroundColor = `rgb(${percent *2}, ${(100 - percent) *2}, 0)`
         field.style.fontWeight = "700"
         field.style.color = "white"
     })
 });
-
@@ -1,30 +1,25 @@
+import time
 from datetime import datetime
 from email.utils import formataddr
 from celery import shared_task 
+from django.apps import apps
 from django.conf import settings
-from django.core.mail import send_mail
-from .models import AdoptionParent, AdoptionParentSponsoring, Child, User
-from .utils import utils
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.urls import reverse
+from .models import AdoptionParent, AdoptionParentSponsoring, Child, Donation, NotificationDigestRun, Sponsor, User
+from .utils import certificates, exports, payments, read_state, snapshot, utils
 
 
-@shared_task
-def notification_mail(user_id):
-
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return "User not found!"
-    
-    # get user notifications
-    child_noti = utils.child_badge_callback(user)
-    adoptionparent_noti = utils.adoptionparent_badge_callback(user)
-    payment_noti = utils.payment_badge_callback(user)
-    sponsor_noti = utils.sponsor_badge_callback(user)
-    donation_noti = utils.donation_badge_callback(user)
+def build_notification_message(user, unread):
+    child_noti = unread[Child]
+    adoptionparent_noti = unread[AdoptionParent]
+    payment_noti = unread[AdoptionParentSponsoring]
+    sponsor_noti = unread[Sponsor]
+    donation_noti = unread[Donation]
     
     # no notifications
-    if all(var == "" for var in [child_noti, adoptionparent_noti, payment_noti, sponsor_noti, donation_noti]):
-        return f"No notifications for {user.username}"
+    if not any([child_noti, adoptionparent_noti, payment_noti, sponsor_noti, donation_noti]):
+        return None
     
     # Construct email body
     message_lines = [f"Beste {user.username},\n\nJe hebt de volgende ongelezen meldingen:"]
@@ -40,7 +35,22 @@ def notification_mail(user_id):
     if donation_noti:
         message_lines.append(f"- Donatie meldingen: {donation_noti}")
 
-    message = "\n".join(message_lines) + "\n\nBekijk ze via vanakaam.be/admin"
+    return "\n".join(message_lines) + "\n\nBekijk ze via vanakaam.be/admin"
+
+
+@shared_task
+def notification_mail(user_id):
+
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return "User not found!"
+    
+    # get user notifications, all models in one go
+    message = build_notification_message(user, utils.get_unread_counts_for_user(user))
+
+    if message is None:
+        return f"No notifications for {user.username}"
     
     send_mail(
         'Je hebt ongelezen meldingen!',
@@ -54,25 +64,109 @@ def notification_mail(user_id):
 
 
 @shared_task
-def add_yearly_adoption_parent_payments():
-    amount_of_sponsors_saved = 0
-    all_children = Child.objects.all()
+def notification_digest():
+    # notification_mail for every staff user at once: the unread counts of all users
+    # are computed together and all mails go over a single SMTP connection
+    run = NotificationDigestRun(started_at=datetime.now())
+    start = time.monotonic()
 
-    for sponsor in AdoptionParent.objects.all():
-        if not sponsor.active:
+    users = User.objects.filter(is_active=True, is_staff=True).exclude(email="")
+    unread_per_user = read_state.unread_counts_for_users(users)
+    run.query_duration = time.monotonic() - start
+
+    messages = []
+    for user in users:
+        message = build_notification_message(user, unread_per_user[user.pk])
+        if message is None:
             continue
-        
-        children_of_sponsor = [c for c in all_children if sponsor in c.get_adoption_parents() and sponsor.active]
-        
-        for child in children_of_sponsor:
-            sp = AdoptionParentSponsoring(
-                date=datetime.now(),
-                amount=0, 
-                parent=sponsor,
-                child=child
-            )
-
-            sp.save()
-            amount_of_sponsors_saved += 1
-
-    return f"{amount_of_sponsors_saved} payments added"
\ No newline at end of file
+
+        messages.append(EmailMessage(
+            'Je hebt ongelezen meldingen!',
+            message,
+            formataddr(('Admin | Saranalaya', settings.EMAIL_HOST_USER)),
+            [user.email],
+        ))
+
+    run.amount_of_users = len(unread_per_user)
+    run.amount_of_mails = len(messages)
+
+    try:
+        if messages:
+            run.amount_of_mails_sent = get_connection(fail_silently=False).send_messages(messages)
+    finally:
+        run.duration = time.monotonic() - start
+        run.save()
+
+    return f"{run.amount_of_mails_sent} notification emails sent to {run.amount_of_users} users"
+
+
+@shared_task
+def compact_read_state():
+    # views from the change pages pile up as exceptions until they are folded into the watermarks
+    deleted = read_state.compact_all()
+    return f"{deleted} read state exceptions removed"
+
+
+@shared_task
+def delete_expired_exports():
+    # the download links only live EXPORT_TIMEOUT in the cache, the files would stay forever
+    deleted = exports.delete_expired()
+    return f"{deleted} expired exports deleted"
+
+
+@shared_task
+def add_yearly_adoption_parent_payments():
+    created, skipped = payments.generate_yearly_payments()
+
+    if created:
+        refresh_dashboard_snapshot()
+
+    return f"{created} payments added, {skipped} skipped"
+
+
+@shared_task
+def refresh_dashboard_snapshot():
+    from .views import get_dashboard_data
+
+    snapshot.refresh("dashboard", get_dashboard_data)
+    return "dashboard snapshot refreshed"
+
+
+@shared_task
+def generate_fiscal_certificates(year=None):
+    """
+    Routed to the certificates queue (CELERY_TASK_ROUTES). Its worker runs with the solo pool,
+    so the task runs in the main process and can render the certificates with a pool of processes.
+    On a normal prefork worker the processes are daemonic and it renders them one after the other,
+    see certificates.can_use_processes.
+    """
+    year = year or datetime.now().year - 1
+    name, amount, per_second = certificates.generate(year)
+    url = reverse('admin:download_certificates', args=[year])
+    return f"{amount} certificates written to {name}, download them at {url} ({per_second:.1f} certificates/s)"
+
+
+@shared_task
+def export_selection(user_id, token, file_format, url):
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return "User not found!"
+
+    selection = exports.get_selection(token)
+    if selection is None or selection["user_id"] != user.pk:
+        return "Selection not found!"
+
+    model = apps.get_model(selection["model"])
+    amount = len(selection["ids"])
+    exports.save_export(user.pk, token, model, exports.iter_selection_rows(selection), file_format)
+
+    send_mail(
+        'Je export is klaar',
+        f"Beste {user.username},\n\nJe export van {amount} rijen kan je downloaden via {url}\n\nDe link blijft 24 uur geldig.",
+        formataddr(('Admin | Saranalaya', settings.EMAIL_HOST_USER)),
+        [user.email],
+        fail_silently=False,
+    )
+
+    return f"export of {amount} {model._meta.verbose_name_plural} sent to {user.username}"
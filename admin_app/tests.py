@@ -1,3 +1,645 @@
-from django.test import TestCase
+import csv
+import io
+import logging
+import math
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import storages
+from django.db import connection
+from django.db.models import Count, Max, Q, Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+import redis
+
+from . import tasks
+from .admin import ChildAdmin, SponsorAdmin
+from .models import (
+    Adoption, AdoptionParent, AdoptionParentSponsoring, Child, Configuration, Donation, ReadWatermark, Sponsor, UserView,
+)
+from .utils import badges, certificates, exports, labels, mailing, read_state, search, utils
+
+
+logger = logging.getLogger(__name__)
+
+# the benchmarks fill the database with many thousands of rows, they only run with BENCHMARK=1
+benchmark = skipUnless(os.environ.get("BENCHMARK"), "set BENCHMARK=1 to run the benchmarks")
+
+# exports and certificates are written to a temporary folder instead of PRIVATE_ROOT
+private_storages = {
+    **settings.STORAGES,
+    'private': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': tempfile.mkdtemp()}},
+}
+
+
+def create_child(name="Anjali", **kwargs):
+    return Child.objects.create(
+        name=name, gender='f', day_of_birth=date(2015, 1, 1), date_of_admission=date(2018, 1, 1),
+        indian_parent_status='a', status='a', **kwargs,
+    )
+
+
+def create_parent(first_name="Jan", last_name="Peeters", **kwargs):
+    kwargs.setdefault('mail', f"{first_name.lower()}.{last_name.lower()}@example.com")
+    return AdoptionParent.objects.create(
+        first_name=first_name, last_name=last_name, street_name="Kerkstraat", address_number=1,
+        postcode="9000", city="Gent", **kwargs,
+    )
+
+
+def create_sponsor(first_name="An", last_name="Janssens", **kwargs):
+    kwargs.setdefault('mail', f"{first_name.lower()}.{last_name.lower()}@example.com")
+    return Sponsor.objects.create(
+        first_name=first_name, last_name=last_name, street_name="Kerkstraat", address_number=1,
+        postcode="9000", city="Gent", **kwargs,
+    )
+
+
+class AdminTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.user)
+
+
+    def count_queries(self, url, data=None):
+        # the first request fills the caches (configuration, content types, badge counts)
+        self.client.get(url, data)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class ArrearsTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.target = Configuration.get().amount_adoption_parents
+        self.parent = create_parent()
+        self.child = create_child()
+        self.first = AdoptionParentSponsoring.objects.create(date=date(2024, 2, 1), amount=self.target / 2, parent=self.parent, child=self.child)
+        self.second = AdoptionParentSponsoring.objects.create(date=date(2024, 9, 1), amount=self.target / 2, parent=self.parent, child=self.child)
+        AdoptionParentSponsoring.objects.create(date=date(2023, 9, 1), amount=10, parent=self.parent, child=self.child)
+
+    def test_year_amount_sums_the_year(self):
+        payment = AdoptionParentSponsoring.objects.with_arrears().get(pk=self.first.pk)
+        self.assertEqual(payment.year_amount, self.target)
+        self.assertEqual(payment.year_amount_left, 0)
+
+    def test_year_amount_ignores_other_filters(self):
+        # only the first payment is selected, the second still counts for the year
+        payment = AdoptionParentSponsoring.objects.filter(date__month=2).with_arrears().get()
+        self.assertEqual(payment.year_amount_left, 0)
+
+    def test_arrears_filter_ignores_other_filters(self):
+        url = reverse('admin:admin_app_adoptionparentsponsoring_changelist')
+        response = self.client.get(url, {'arrears': 'up_to_date', 'date_from': '2024-02-01', 'date_to': '2024-02-28'})
+        self.assertEqual([payment.pk for payment in response.context['cl'].result_list], [self.first.pk])
+
+
+class MailingTests(AdminTestCase):
+
+    def test_batches_cover_every_address_once(self):
+        # the same names, so the default ordering of adoption parents isn't unique
+        for number in range(120):
+            create_parent(last_name=f"Peeters {number % 7}", mail=f"parent{number}@example.com")
+        create_parent(mail="parent0@example.com")
+        create_parent(mail="")
+
+        mailing_list = mailing.get_mailing_list(self.user, mailing.create_mailing_list(self.user, AdoptionParent.objects.all()))
+        batches = [mailing.get_batch(mailing_list, batch) for batch in range(3)]
+
+        self.assertEqual([len(batch) for batch in batches], [50, 50, 20])
+        mails = [mail for batch in batches for mail in batch]
+        self.assertCountEqual(mails, [f"parent{number}@example.com" for number in range(120)])
+
+
+class UnreadCountTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.children = [create_child(name=f"Kind {number}") for number in range(5)]
+        # the content types are cached after the first use
+        read_state.unread_counts(self.user)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            counts = read_state.unread_counts(self.user)
+
+        return counts, len(queries)
+
+    def test_one_query_however_many_views(self):
+        counts, before = self.count_queries()
+        self.assertEqual(counts[Child], 5)
+
+        for child in self.children[:3]:
+            read_state.mark_viewed(self.user, Child, child.pk)
+        for number in range(50):
+            read_state.mark_viewed(self.user, Child, 1000 + number)
+
+        counts, after = self.count_queries()
+        self.assertEqual(counts[Child], 2)
+        self.assertEqual(before, 1)
+        self.assertEqual(after, before)
+
+    def test_sidebar_badges_share_one_query(self):
+        request = RequestFactory().get('/admin/')
+        request.user = self.user
+
+        with self.assertNumQueries(1):
+            badges = [
+                utils.child_badge_callback(request), utils.adoptionparent_badge_callback(request),
+                utils.payment_badge_callback(request), utils.sponsor_badge_callback(request),
+                utils.donation_badge_callback(request),
+            ]
+
+        self.assertEqual(badges, ["5", "", "", "", ""])
+
+    def test_empty_sidebar_badges_are_hidden(self):
+        response = self.client.get(reverse('admin:index'))
+
+        self.assertContains(response, 'data-badge hidden', count=4)
+        self.assertNotContains(response, 'admin_app.utils.utils.')
+
+    def test_unreachable_redis_is_logged(self):
+        connection = mock.Mock()
+        connection.publish.side_effect = redis.ConnectionError()
+
+        with mock.patch.object(badges, 'get_redis', return_value=connection), \
+                self.assertLogs('admin_app.utils.badges', 'WARNING'):
+            badges.changed(self.user.pk)
+
+    def test_counts_of_a_user_are_cached(self):
+        utils.get_unread_counts_for_user(self.user)
+
+        with self.assertNumQueries(0):
+            counts = utils.get_unread_counts_for_user(self.user)
+
+        self.assertEqual(counts[Child], 5)
+
+
+class ChangelistQueryTests(AdminTestCase):
+
+    def add_adoptions(self, amount):
+        for number in range(amount):
+            child = create_child(name=f"Kind {Child.objects.count()}")
+            for parent_number in range(2):
+                parent = create_parent(last_name=f"Peeters {child.pk}-{parent_number}")
+                Adoption.objects.create(adoptionparent=parent, child=child)
+
+    def assertQueriesIndependentOfRows(self, url):
+        self.add_adoptions(2)
+        few = self.count_queries(url)
+
+        self.add_adoptions(8)
+        many = self.count_queries(url)
+
+        self.assertEqual(many, few)
+
+    def test_child_changelist(self):
+        self.assertQueriesIndependentOfRows(reverse('admin:admin_app_child_changelist'))
+
+    def test_adoptionparent_changelist(self):
+        self.assertQueriesIndependentOfRows(reverse('admin:admin_app_adoptionparent_changelist'))
+
+    def test_name_column_orders_on_the_name(self):
+        for name in ("Bala", "Chitra", "Anjali"):
+            create_child(name=name)
+        read_state.mark_viewed(self.user, Child, Child.objects.get(name="Chitra").pk)
+
+        # the first column of the changelist is the action checkbox
+        column = ChildAdmin.list_display.index('changed_and_name') + 1
+        response = self.client.get(reverse('admin:admin_app_child_changelist'), {'o': f"{column}"})
+
+        names = [child.name for child in response.context['cl'].result_list]
+        self.assertEqual(names, ["Anjali", "Bala", "Chitra"])
+
+
+class LabelTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for number in range(30):
+            create_parent(first_name="Jan", last_name=f"Label{number:02d}")
+
+    def test_every_address_once(self):
+        for name, sheet in labels.LABEL_SHEETS.items():
+            with self.subTest(sheet=name):
+                reader = PdfReader(labels.generate_labels(AdoptionParent.objects.all(), sheet))
+                self.assertEqual(len(reader.pages), math.ceil(30 / sheet.labels_per_page))
+
+                text = " ".join(page.extract_text() for page in reader.pages)
+                for number in range(30):
+                    self.assertEqual(text.count(f"Label{number:02d}"), 1)
+
+    def test_labels_stay_on_the_page(self):
+        for name, sheet in labels.LABEL_SHEETS.items():
+            with self.subTest(sheet=name):
+                x, y = sheet.get_position(sheet.labels_per_page - 1)
+                lowest_line = y - sheet.font_size - 3 * sheet.line_height
+                self.assertGreaterEqual(lowest_line, 0)
+                self.assertLess(x, sheet.pagesize[0])
+                # the next label starts on top of a new page
+                self.assertEqual(sheet.get_position(sheet.labels_per_page), sheet.get_position(0))
+
+
+class ReadStateTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.children = [create_child(name=f"Kind {number}") for number in range(4)]
+        # changed long ago, so the watermark can pass them
+        Child.objects.update(last_updated=timezone.now() - timedelta(days=1))
+
+    def unread(self):
+        return set(read_state.unread_queryset(Child, self.user).values_list('pk', flat=True))
+
+    def test_mark_read(self):
+        self.assertEqual(read_state.mark_read(self.user, Child.objects.all()), 4)
+
+        self.assertEqual(self.unread(), set())
+        # folded into the watermark, no exceptions are left
+        self.assertFalse(UserView.objects.filter(user=self.user).exists())
+
+    def test_edit_after_read(self):
+        read_state.mark_read(self.user, Child.objects.all())
+
+        self.children[0].description = "Nieuw schooljaar"
+        self.children[0].save()
+
+        self.assertEqual(self.unread(), {self.children[0].pk})
+
+    def test_mark_unread(self):
+        read_state.mark_read(self.user, Child.objects.all())
+
+        self.assertEqual(read_state.mark_unread(self.user, Child.objects.filter(pk=self.children[1].pk)), 1)
+        self.assertEqual(self.unread(), {self.children[1].pk})
+
+        read_state.mark_read(self.user, Child.objects.filter(pk=self.children[1].pk))
+        self.assertEqual(self.unread(), set())
+
+    def test_watermark_stays_behind_now(self):
+        recent = create_child(name="Recent")
+        read_state.mark_read(self.user, Child.objects.all())
+
+        watermark = ReadWatermark.objects.get(user=self.user).seen_until
+        self.assertLessEqual(watermark, timezone.now() - read_state.WATERMARK_MARGIN)
+        # the recent child is read through its exception until the watermark passes it
+        self.assertEqual(self.unread(), set())
+        self.assertTrue(UserView.objects.filter(user=self.user, object_id=recent.pk).exists())
+
+        # saved in a transaction that only commits now, with a last_updated before the last compact
+        late = create_child(name="Late")
+        Child.objects.filter(pk=late.pk).update(last_updated=timezone.now() - timedelta(minutes=1))
+        read_state.compact(self.user, Child)
+
+        self.assertEqual(self.unread(), {late.pk})
+
+    def test_watermark_never_moves_back(self):
+        read_state.mark_read(self.user, Child.objects.all())
+        watermark = ReadWatermark.objects.get(user=self.user).seen_until
+
+        Child.objects.filter(pk=self.children[0].pk).update(last_updated=watermark - timedelta(hours=1))
+        read_state.mark_unread(self.user, Child.objects.filter(pk=self.children[0].pk))
+
+        self.assertGreaterEqual(ReadWatermark.objects.get(user=self.user).seen_until, watermark)
+        self.assertEqual(self.unread(), {self.children[0].pk})
+
+
+@skipUnless(search.is_supported(), "full text search needs postgres")
+class SearchTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.child = create_child(name="Lakshmi")
+        self.parent = create_parent(first_name="Els", last_name="Vermeulen")
+        Adoption.objects.create(adoptionparent=self.parent, child=self.child)
+        create_child(name="Divya")
+
+    def search_children(self, term):
+        response = self.client.get(reverse('admin:admin_app_child_changelist'), {'q': term})
+        return [child.pk for child in response.context['cl'].result_list]
+
+    def test_child_by_parent_name(self):
+        self.assertEqual(self.search_children("Vermeulen"), [self.child.pk])
+        self.assertEqual(self.search_children("els verm"), [self.child.pk])
+
+    def test_child_by_renamed_parent(self):
+        self.parent.last_name = "Wouters"
+        self.parent.save()
+
+        self.assertEqual(self.search_children("Wouters"), [self.child.pk])
+        self.assertEqual(self.search_children("Vermeulen"), [])
+
+    def test_name_with_a_typo(self):
+        self.assertEqual(self.search_children("Lakshmy"), [self.child.pk])
+
+
+class DonationTotalTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        this_year = date.today().year
+        self.sponsors = [create_sponsor(last_name=f"Janssens {number}") for number in range(4)]
+
+        for number, sponsor in enumerate(self.sponsors[:3]):
+            for year in (this_year - 2, this_year - 1, this_year):
+                for month in range(1, number + 2):
+                    Donation.objects.create(sponsor=sponsor, amount=10 * number + month, date=date(year, month, 1))
+
+        # changed and moved to another sponsor afterwards, the totals have to follow
+        donation = Donation.objects.filter(sponsor=self.sponsors[2]).first()
+        donation.amount = 99
+        donation.sponsor = self.sponsors[1]
+        donation.save()
+        Donation.objects.filter(sponsor=self.sponsors[0]).last().delete()
+
+    def test_totals_equal_the_donations(self):
+        this_year = date.today().year
+        sponsors = Sponsor.objects.with_donation_totals().in_bulk()
+
+        for sponsor in self.sponsors:
+            donations = Donation.objects.filter(sponsor=sponsor)
+            expected = donations.aggregate(total=Sum('amount', default=0), count=Count('pk'), last=Max('date'))
+            annotated = sponsors[sponsor.pk]
+
+            with self.subTest(sponsor=sponsor.last_name):
+                self.assertAlmostEqual(annotated.donation_total, expected['total'])
+                self.assertAlmostEqual(
+                    annotated.donations_this_year, donations.filter(date__year=this_year).aggregate(total=Sum('amount', default=0))['total'],
+                )
+                self.assertEqual(annotated.donation_count, expected['count'])
+                self.assertEqual(annotated.last_donation_date, expected['last'])
+
+    def test_changelist_orders_on_the_totals(self):
+        # the first column of the changelist is the action checkbox
+        column = SponsorAdmin.list_display.index('donation_total') + 1
+        response = self.client.get(reverse('admin:admin_app_sponsor_changelist'), {'o': f"-{column}"})
+
+        totals = [sponsor.donation_total for sponsor in response.context['cl'].result_list]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        self.assertEqual(len(totals), 4)
+
+
+@override_settings(STORAGES=private_storages)
+@mock.patch.object(exports, 'CHUNK_SIZE', 4)
+class ExportTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        sponsor = create_sponsor()
+        for number in range(10):
+            Donation.objects.create(sponsor=sponsor, amount=number + 1, date=date(2024, 1, number + 1))
+
+        self.selected = sorted(Donation.objects.filter(amount__lte=7).values_list('pk', flat=True))
+
+    def export(self, file_format):
+        return self.client.post(reverse('admin:admin_app_donation_changelist'), {
+            'action': f'export_{file_format}', '_selected_action': self.selected,
+        })
+
+    def read_csv(self, content):
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        return rows[0], sorted(int(row[0]) for row in rows[1:])
+
+    def test_csv_covers_the_selection(self):
+        response = self.export('csv')
+
+        header, ids = self.read_csv(b"".join(response.streaming_content))
+        self.assertEqual(header[0], "ID")
+        self.assertEqual(ids, self.selected)
+
+    def test_xlsx_covers_the_selection(self):
+        response = self.export('xlsx')
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as xlsx:
+            sheet = xlsx.read('xl/worksheets/sheet1.xml').decode()
+
+        # the id is the number in the first column of every row after the header
+        ids = sorted(int(value) for value in re.findall(r'<c r="A\d+"><v>(\d+)</v></c>', sheet))
+        self.assertEqual(sheet.count('<row '), len(self.selected) + 1)
+        self.assertEqual(ids, self.selected)
+
+    @mock.patch.object(exports, 'BACKGROUND_THRESHOLD', 2)
+    def test_background_export(self):
+        # the task runs right away instead of on a worker
+        with mock.patch.object(tasks.export_selection, 'delay', side_effect=tasks.export_selection) as delay:
+            response = self.export('csv')
+        self.assertEqual(response.status_code, 302)
+
+        # the ids stay on the server, only the token goes to the task
+        self.assertFalse(any(isinstance(argument, list) for argument in delay.call_args.args))
+
+        # the link in the mail downloads the whole selection
+        url = re.search(r'https?://\S+', mail.outbox[-1].body).group()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        header, ids = self.read_csv(b"".join(response.streaming_content))
+        self.assertEqual(ids, self.selected)
+
+        # nobody else can download it
+        other = User.objects.create_superuser("other", "other@example.com", "password")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_expired_exports_are_deleted(self):
+        storage = storages['private']
+        rows = list(exports.iter_rows(Donation.objects.all()))
+        old = exports.save_export(self.user.pk, exports.create_token(), Donation, rows, 'csv')
+        recent = exports.save_export(self.user.pk, exports.create_token(), Donation, rows, 'csv')
+
+        expired = time.time() - exports.EXPORT_TIMEOUT - 60
+        os.utime(storage.path(old), (expired, expired))
+
+        self.assertEqual(exports.delete_expired(), 1)
+        self.assertFalse(storage.exists(os.path.dirname(old)))
+        self.assertTrue(storage.exists(recent))
+
+
+@override_settings(STORAGES=private_storages)
+class CertificateTests(AdminTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.donor = create_sponsor(last_name="Peeters")
+        Donation.objects.create(sponsor=self.donor, amount=30, date=date(2024, 3, 1))
+        Donation.objects.create(sponsor=self.donor, amount=15, date=date(2024, 9, 1))
+        Donation.objects.create(sponsor=self.donor, amount=100, date=date(2023, 9, 1))
+        # below the minimum amount
+        Donation.objects.create(sponsor=create_sponsor(last_name="Janssens"), amount=39, date=date(2024, 5, 1))
+
+    def test_only_donors_that_gave_the_minimum(self):
+        donors = certificates.get_donors(2024)
+
+        self.assertEqual([donor['sponsor_id'] for donor in donors], [self.donor.pk])
+        self.assertEqual(donors[0]['total'], 45)
+        self.assertEqual(donors[0]['count'], 2)
+
+    def test_zip_in_the_private_storage(self):
+        name, amount, _per_second = certificates.generate(2024, workers=1)
+
+        self.assertEqual(amount, 1)
+        self.assertEqual(name, certificates.get_zip_name(2024))
+        self.assertFalse(storages['default'].exists(name))
+
+        with storages['private'].open(name) as output, zipfile.ZipFile(output) as archive:
+            filename = certificates.get_filename(2024, certificates.get_donors(2024)[0])
+            self.assertEqual(archive.namelist(), [filename])
+            text = PdfReader(io.BytesIO(archive.read(filename))).pages[0].extract_text()
+
+        self.assertIn("Peeters", text)
+        self.assertIn("45.00", text)
+
+    def test_download_needs_the_donation_permission(self):
+        certificates.generate(2024, workers=1)
+        url = reverse('admin:download_certificates', args=[2024])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("fiscaal_attesten_2024.zip", response['Content-Disposition'])
+
+        staff = User.objects.create_user("staff", "staff@example.com", "password", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_year_without_certificates(self):
+        response = self.client.get(reverse('admin:download_certificates', args=[2020]))
+        self.assertEqual(response.status_code, 404)
+
+
+@benchmark
+class LabelBenchmark(AdminTestCase):
+
+    def test_ten_thousand_addresses(self):
+        AdoptionParent.objects.bulk_create([
+            AdoptionParent(
+                first_name="Jan", last_name=f"Peeters {number}", street_name="Kerkstraat", address_number=number,
+                postcode="9000", city="Gent", mail=f"jan{number}@example.com",
+            )
+            for number in range(10000)
+        ])
+        sheet = labels.LABEL_SHEETS["a4-3x8"]
+
+        tracemalloc.start()
+        start = time.monotonic()
+        output = labels.generate_labels(AdoptionParent.objects.all(), sheet)
+        duration = time.monotonic() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertEqual(len(PdfReader(output).pages), math.ceil(10000 / sheet.labels_per_page))
+        logger.info("labels: 10000 addresses in %.2fs, peak python memory %.1f MB", duration, peak / 1024 / 1024)
+        # the addresses are read in chunks, the pdf is spooled to disk
+        self.assertLess(peak, 50 * 1024 * 1024)
+
+
+@benchmark
+class ReadStateBenchmark(AdminTestCase):
+
+    def timed(self, function, *args):
+        start = time.monotonic()
+        result = function(*args)
+        return result, time.monotonic() - start
+
+    def test_hundred_thousand_children(self):
+        Child.objects.bulk_create([
+            Child(
+                name=f"Kind {number}", gender='f', day_of_birth=date(2015, 1, 1), date_of_admission=date(2018, 1, 1),
+                indian_parent_status='a', status='a',
+            )
+            for number in range(100000)
+        ], batch_size=5000)
+        Child.objects.update(last_updated=timezone.now() - timedelta(days=1))
+
+        counts, count_duration = self.timed(read_state.unread_counts, self.user)
+        self.assertEqual(counts[Child], 100000)
+
+        marked, mark_duration = self.timed(read_state.mark_read, self.user, Child.objects.all())
+        self.assertEqual(marked, 100000)
+
+        counts, read_count_duration = self.timed(read_state.unread_counts, self.user)
+        self.assertEqual(counts[Child], 0)
+        # folded into the watermark, the exceptions are gone again
+        self.assertFalse(UserView.objects.filter(user=self.user).exists())
+
+        logger.info(
+            "read state: 100000 children, counting unread %.2fs, mark all read %.2fs, counting after %.3fs",
+            count_duration, mark_duration, read_count_duration,
+        )
+
+
+@benchmark
+@skipUnless(search.is_supported(), "full text search needs postgres")
+class SearchBenchmark(AdminTestCase):
+
+    def timed_search(self, term, repeat=5):
+        start = time.monotonic()
+        for _ in range(repeat):
+            results = list(search.search(Child.objects.all(), term).order_by('-search_rank')[:100].values_list('pk', flat=True))
+        return results, (time.monotonic() - start) / repeat
+
+    def test_fifty_thousand_children(self):
+        parents = AdoptionParent.objects.bulk_create([
+            AdoptionParent(
+                first_name="Jan", last_name=f"Peeters{number}", street_name="Kerkstraat", address_number=1,
+                postcode="9000", city="Gent", mail=f"jan{number}@example.com",
+            )
+            for number in range(25000)
+        ], batch_size=5000)
+        children = Child.objects.bulk_create([
+            Child(
+                name=f"Kind{number}", gender='f', day_of_birth=date(2015, 1, 1), date_of_admission=date(2018, 1, 1),
+                indian_parent_status='a', status='a',
+            )
+            for number in range(50000)
+        ], batch_size=5000)
+        Adoption.objects.bulk_create([
+            Adoption(adoptionparent=parents[number // 2], child=child) for number, child in enumerate(children)
+        ], batch_size=5000)
+
+        start = time.monotonic()
+        search.update_search_vectors(Child)
+        vector_duration = time.monotonic() - start
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE admin_app_child")
+
+        by_parent, parent_duration = self.timed_search("Peeters12345")
+        self.assertEqual(set(by_parent), {children[24690].pk, children[24691].pk})
+
+        by_prefix, prefix_duration = self.timed_search("Kind4999")
+        self.assertIn(children[4999].pk, by_prefix)
+
+        # what the changelist did before: icontains over the fields and their joins
+        start = time.monotonic()
+        for _ in range(5):
+            list(
+                Child.objects.filter(Q(name__icontains="Peeters12345") | Q(adoptionparent__last_name__icontains="Peeters12345"))
+                .distinct()[:100].values_list('pk', flat=True)
+            )
+        icontains_duration = (time.monotonic() - start) / 5
+
+        logger.info(
+            "search: 50000 children, filling the vectors %.2fs, by parent name %.3fs, by name prefix %.3fs, icontains %.3fs",
+            vector_duration, parent_duration, prefix_duration, icontains_duration,
+        )
@@ -0,0 +1,100 @@
+import json
+import logging
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import snapshot
+
+
+CHANNEL = "badges"
+
+# cached counts are dropped after this anyway, in case an invalidation got lost
+BADGE_TIMEOUT = 60 * 60
+
+# send a comment now and then, so proxies don't close an idle stream
+KEEPALIVE_INTERVAL = 25
+
+_redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.CACHES['default']['LOCATION'])
+
+    return _redis
+
+
+def get_key(user_id):
+    # the global version changes with every tracked object, so all users get new counts
+    return f"badges:{user_id}:{snapshot.get_version('badges')}"
+
+
+def get_counts(user, compute):
+    """The cached compute(user), a dict of unread counts per model"""
+    key = get_key(user.pk)
+    counts = cache.get(key)
+
+    if counts is None:
+        counts = compute(user)
+        cache.set(key, counts, timeout=BADGE_TIMEOUT)
+
+    return counts
+
+
+def changed(user_id=None):
+    """
+    Drop the cached counts of one user (their read state changed) or of everyone (an object changed)
+    and tell the open badge streams about it.
+    """
+    if user_id is None:
+        snapshot.invalidate("badges")
+    else:
+        cache.delete(get_key(user_id))
+
+    # called in on_commit, an unreachable redis only means the open streams update later
+    try:
+        get_redis().publish(CHANNEL, json.dumps({"user_id": user_id}))
+    except redis.RedisError:
+        logger.warning("Could not publish the badge change of user %s", user_id, exc_info=True)
+
+
+def format_event(counts):
+    data = json.dumps({model._meta.model_name: amount for model, amount in counts.items()})
+    return f"event: badges\ndata: {data}\n\n"
+
+
+async def stream(user, compute):
+    """Server-Sent Events with the badge counts of the user, sent again whenever they change"""
+    connection = redis.asyncio.Redis.from_url(settings.CACHES['default']['LOCATION'])
+    pubsub = connection.pubsub()
+    await pubsub.subscribe(CHANNEL)
+
+    try:
+        counts = await sync_to_async(get_counts)(user, compute)
+        yield format_event(counts)
+
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_INTERVAL)
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            user_id = json.loads(message['data'])['user_id']
+            if user_id is not None and user_id != user.pk:
+                continue
+
+            new_counts = await sync_to_async(get_counts)(user, compute)
+            if new_counts != counts:
+                counts = new_counts
+                yield format_event(counts)
+    finally:
+        await pubsub.unsubscribe(CHANNEL)
+        await pubsub.aclose()
+        await connection.aclose()
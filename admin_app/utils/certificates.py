@@ -0,0 +1,205 @@
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.contrib.staticfiles import finders
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db.models import Count, Sum
+from django.utils.text import slugify
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from ..models import Configuration, Donation
+
+
+# donors only get a fiscal certificate when they gave at least this much in the year
+MINIMUM_AMOUNT = 40
+
+# zips bigger than this are spooled to a temporary file before they go to the storage
+SPOOL_MAX_SIZE = 20 * 1024 * 1024
+
+# certificates sent to a worker process at once
+CHUNK_SIZE = 16
+
+SPONSOR_FIELDS = (
+    'sponsor_id', 'sponsor__first_name', 'sponsor__last_name', 'sponsor__firm', 'sponsor__street_name',
+    'sponsor__address_number', 'sponsor__bus', 'sponsor__postcode', 'sponsor__city', 'sponsor__country',
+)
+
+# set by init_worker, once per process
+_logo = None
+_organisation = None
+
+
+def get_donors(year):
+    """Every sponsor that gave enough in the year, with their total, in a single query"""
+    return list(
+        Donation.objects.filter(date__year=year)
+        .order_by()
+        .values(*SPONSOR_FIELDS)
+        .annotate(total=Sum('amount'), count=Count('pk'))
+        .filter(total__gte=MINIMUM_AMOUNT)
+        .order_by('sponsor__last_name', 'sponsor__first_name', 'sponsor_id')
+    )
+
+
+def get_organisation():
+    configuration = Configuration.get()
+    return {
+        "name": configuration.organisation_name,
+        "number": configuration.organisation_number,
+        "address": configuration.organisation_address,
+    }
+
+
+def init_worker(font_paths, logo_path, organisation):
+    # fonts and logo are loaded once per process instead of once per certificate
+    global _logo, _organisation
+
+    for name, path in font_paths.items():
+        pdfmetrics.registerFont(TTFont(name, path))
+
+    _logo = ImageReader(logo_path)
+    _organisation = organisation
+
+
+def get_worker_args():
+    # resolved in the main process, the workers don't need the staticfiles finders
+    font_paths = {
+        'Outfit': finders.find('fonts/Outfit-Regular.ttf'),
+        'Outfit-Bold': finders.find('fonts/Outfit-Bold.ttf'),
+    }
+    return font_paths, finders.find('images/logo-with-bg.jpg'), get_organisation()
+
+
+def get_number(year, donor):
+    return f"{year}-{donor['sponsor_id']:06d}"
+
+
+def get_filename(year, donor):
+    return f"fiscaal_attest_{get_number(year, donor)}_{slugify(donor['sponsor__last_name'])}.pdf"
+
+
+def render_certificate(year, issue_date, donor):
+    """The fiscal certificate of a single donor as PDF bytes"""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    width, height = A4
+
+    p.drawImage(_logo, 70, height - 100, 427 * 0.3, 58 * 0.3)
+
+    p.setFont("Outfit-Bold", 20)
+    p.drawString(70, height - 150, f"Fiscaal attest giften {year}")
+    p.setFont("Outfit", 10)
+    p.drawString(70, height - 168, f"Attest nr. {get_number(year, donor)}")
+
+    # the organisation that received the gifts
+    y = height - 210
+    p.setFont("Outfit-Bold", 11)
+    p.drawString(70, y, _organisation["name"])
+    p.setFont("Outfit", 11)
+    for line in _organisation["address"].splitlines():
+        y -= 15
+        p.drawString(70, y, line)
+    if _organisation["number"]:
+        y -= 15
+        p.drawString(70, y, f"Ondernemingsnummer: {_organisation['number']}")
+
+    # the donor
+    y -= 45
+    p.setFont("Outfit-Bold", 11)
+    p.drawString(300, y, f"{donor['sponsor__first_name']} {donor['sponsor__last_name']}")
+    p.setFont("Outfit", 11)
+    address_lines = [
+        donor['sponsor__firm'],
+        f"{donor['sponsor__street_name']} {donor['sponsor__address_number']} {donor['sponsor__bus'] or ''}",
+        f"{donor['sponsor__postcode']} {donor['sponsor__city']}",
+        donor['sponsor__country'],
+    ]
+    for line in address_lines:
+        if line:
+            y -= 15
+            p.drawString(300, y, line)
+
+    y -= 60
+    p.setFont("Outfit", 12)
+    p.drawString(70, y, f"{_organisation['name']} bevestigt in {year} als gift, zonder enige tegenprestatie,")
+    p.drawString(70, y - 18, f"het bedrag van € {donor['total']:.2f} ontvangen te hebben van de hierboven vermelde schenker.")
+
+    p.setFont("Outfit", 10)
+    p.drawString(70, y - 60, f"Uitgereikt op {issue_date.strftime('%d/%m/%Y')}")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def render_chunk(year, issue_date, donors):
+    return [render_certificate(year, issue_date, donor) for donor in donors]
+
+
+def can_use_processes():
+    # celery runs its tasks in daemonic processes, those are not allowed to start children
+    return not multiprocessing.current_process().daemon
+
+
+def iter_certificates(year, donors, workers=None):
+    """The PDF of every donor, in the same order, rendered by a pool of processes when possible"""
+    issue_date = date.today()
+    chunks = [donors[start:start + CHUNK_SIZE] for start in range(0, len(donors), CHUNK_SIZE)]
+    worker_args = get_worker_args()
+
+    if workers == 1 or len(chunks) <= 1 or not can_use_processes():
+        init_worker(*worker_args)
+        for chunk in chunks:
+            yield from render_chunk(year, issue_date, chunk)
+        return
+
+    # forked, so the workers don't have to set up django again
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=init_worker,
+        initargs=worker_args,
+    ) as executor:
+        futures = [executor.submit(render_chunk, year, issue_date, chunk) for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def get_zip_name(year):
+    return f"certificates/{year}/fiscaal_attesten_{year}.zip"
+
+
+def generate(year, workers=None):
+    """
+    Render the fiscal certificates of the year and store them in one zip in the private storage,
+    staff download it through the download_certificates view.
+    Returns the name of the zip, the amount of certificates and the certificates per second.
+    """
+    start = time.monotonic()
+    donors = get_donors(year)
+
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for donor, pdf in zip(donors, iter_certificates(year, donors, workers)):
+            archive.writestr(get_filename(year, donor), pdf)
+
+    output.seek(0)
+    # a new run replaces the zip of the year, so the download link stays the same
+    storage = storages["private"]
+    storage.delete(get_zip_name(year))
+    name = storage.save(get_zip_name(year), File(output))
+    output.close()
+
+    duration = time.monotonic() - start
+    return name, len(donors), len(donors) / duration if duration else 0
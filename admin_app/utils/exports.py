@@ -0,0 +1,311 @@
+import csv
+import re
+import secrets
+import zipfile
+from datetime import date, datetime, timedelta
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import storages
+from django.utils import timezone
+
+
+# rows are fetched from the database in chunks of this size
+CHUNK_SIZE = 2000
+
+# selections bigger than this are exported by a celery task instead of in the request
+BACKGROUND_THRESHOLD = 20000
+
+# how long the file of a background export stays downloadable, delete_expired removes it afterwards
+EXPORT_TIMEOUT = 24 * 60 * 60
+
+# exports bigger than this are spooled to a temporary file before they go to the storage
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+SUPPORTER_FIELDS = (
+    'id', 'first_name', 'last_name', 'firm', 'street_name', 'address_number', 'bus',
+    'postcode', 'city', 'country', 'mail', 'phone_number',
+)
+
+EXPORT_FIELDS = {
+    'donation': (
+        'id', 'date', 'amount', 'sponsor__first_name', 'sponsor__last_name', 'sponsor__firm', 'sponsor__mail', 'description',
+    ),
+    'adoptionparentsponsoring': (
+        'id', 'date', 'amount', 'parent__first_name', 'parent__last_name', 'parent__firm', 'child__name', 'description',
+    ),
+    'sponsor': SUPPORTER_FIELDS + ('letters',),
+    'adoptionparent': SUPPORTER_FIELDS + ('active',),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class Echo:
+    # file-like object of which write returns the value, used to stream a csv
+    def write(self, value):
+        return value
+
+
+class ChunkBuffer:
+    # file-like object that keeps what is written until it is taken, used to stream a zip
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, value):
+        self.chunks.append(bytes(value))
+        return len(value)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_fields(model):
+    return EXPORT_FIELDS[model._meta.model_name]
+
+
+def get_header(model, field_path):
+    # verbose name of the field, prefixed with the verbose name of the relation it is read through
+    names = []
+    for part in field_path.split('__'):
+        field = model._meta.get_field(part)
+        names.append(str(field.verbose_name))
+        model = field.related_model
+
+    return " ".join(names)
+
+
+def iter_rows(queryset):
+    fields = get_fields(queryset.model)
+    return queryset.prefetch_related(None).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def iter_selection_rows(selection):
+    """The rows of the stored selection in the order of its ids, read in chunks of CHUNK_SIZE"""
+    model = apps.get_model(selection["model"])
+    fields = get_fields(model)
+    ids = selection["ids"]
+
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        # the id is the first field of every export
+        rows = {row[0]: row for row in model.objects.filter(pk__in=chunk).values_list(*fields)}
+        for pk in chunk:
+            # rows that were deleted in the meantime
+            if pk in rows:
+                yield rows[pk]
+
+
+def stream_csv(model, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow([get_header(model, field) for field in get_fields(model)])
+
+    for row in rows:
+        yield writer.writerow(row)
+
+
+# a minimal workbook with a single sheet, the cells hold their strings inline
+# so no shared strings table has to be kept in memory
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # the second cell format shows a date (built-in number format 14)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf/><xf numFmtId="14" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+# characters that are not allowed in xml
+ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def get_column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+
+    return letters
+
+
+def format_cell(reference, value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return f'<c r="{reference}" s="1"><v>{(value - EXCEL_EPOCH).days}</v></c>'
+
+    text = escape(ILLEGAL_CHARACTERS.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def format_row(row_number, row):
+    cells = "".join(format_cell(f"{get_column_letter(index)}{row_number}", value) for index, value in enumerate(row))
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+def stream_xlsx(model, rows):
+    """
+    The rows as an xlsx file, yielded in pieces while it is written.
+    The zip is written without seeking, so nothing but the current chunk stays in memory.
+    """
+    output = ChunkBuffer()
+
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as xlsx:
+        for name, content in XLSX_PARTS.items():
+            xlsx.writestr(name, content)
+
+        with xlsx.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            sheet.write(format_row(1, [get_header(model, field) for field in get_fields(model)]).encode())
+
+            for row_number, row in enumerate(rows, start=2):
+                sheet.write(format_row(row_number, row).encode())
+
+                data = output.take()
+                if data:
+                    yield data
+
+            sheet.write(SHEET_END.encode())
+
+    yield output.take()
+
+
+def stream_export(model, rows, file_format):
+    if file_format == 'csv':
+        return stream_csv(model, rows)
+
+    return stream_xlsx(model, rows)
+
+
+def get_filename(model, file_format):
+    return f"{model._meta.model_name}_export_{date.today().isoformat()}.{file_format}"
+
+
+def create_token():
+    return secrets.token_urlsafe(16)
+
+
+def create_selection(user, queryset):
+    """
+    Store the ids of a big selection server side for the celery task, like the mailing lists,
+    so they don't have to travel in the task message. Returns the token of the export.
+    """
+    token = create_token()
+    # in the order of the changelist
+    ids = list(queryset.order_by(*queryset.model._meta.ordering, 'pk').values_list('pk', flat=True).iterator(chunk_size=CHUNK_SIZE))
+
+    cache.set(f"export_selection:{token}", {
+        "user_id": user.pk,
+        "model": queryset.model._meta.label,
+        "ids": ids,
+    }, timeout=EXPORT_TIMEOUT)
+
+    return token
+
+
+def get_selection(token):
+    return cache.get(f"export_selection:{token}")
+
+
+def save_export(user_id, token, model, rows, file_format):
+    """Write the export to the private storage, so the user can download it with the token"""
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    for chunk in stream_export(model, rows, file_format):
+        output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
+    output.seek(0)
+    name = storages["private"].save(f"exports/{token}/{get_filename(model, file_format)}", File(output))
+    output.close()
+
+    cache.set(f"export:{token}", {"user_id": user_id, "name": name}, timeout=EXPORT_TIMEOUT)
+    cache.delete(f"export_selection:{token}")
+    return name
+
+
+def get_export(user, token):
+    export = cache.get(f"export:{token}")
+    if export is None or export["user_id"] != user.pk:
+        return None
+
+    return export
+
+
+def delete_expired():
+    """Delete the files of the exports whose download link has expired"""
+    storage = storages["private"]
+    if not storage.exists("exports"):
+        return 0
+
+    cutoff = timezone.now() - timedelta(seconds=EXPORT_TIMEOUT)
+    deleted = 0
+    for token in storage.listdir("exports")[0]:
+        folder = f"exports/{token}"
+        names = [f"{folder}/{filename}" for filename in storage.listdir(folder)[1]]
+        if any(storage.get_modified_time(name) > cutoff for name in names):
+            continue
+
+        for name in names:
+            storage.delete(name)
+        storage.delete(folder)
+        deleted += 1
+
+    return deleted
@@ -1,6 +1,9 @@
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from django.http import FileResponse
+from django.contrib import messages
+from django.http import FileResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.translation import gettext as _
+
+from . import exports, labels, mailing
 
 
 def get_years_from_request(request):
@@ -16,37 +19,42 @@ def get_last_available_adoption_sponsoring_year(parent_sponsors):
 
 # mailing and adress list
 def generateMailList(modeladmin, request, queryset):
-    supporters = queryset.all()
-    return ','.join([sup.mail for sup in supporters if sup.mail])
+    # only a token goes to the mailto page, the recipients stay on the server
+    token = mailing.create_mailing_list(request.user, queryset)
+    return HttpResponseRedirect(reverse('admin:generate_mailto_link', args=[token]))
 
 
-def generateAddressList(modeladmin, request, queryset):
-    response = FileResponse(generateAddressListFile(queryset), 
+def generateAddressList(modeladmin, request, queryset, sheet="list"):
+    # the file is streamed in blocks from the (spooled) temporary file
+    response = FileResponse(generateAddressListFile(queryset, sheet), 
                             as_attachment=True, 
-                            filename='address_list.pdf')
+                            filename='address_list.pdf' if sheet == "list" else 'address_labels.pdf')
     return response
 
 
-def generateAddressListFile(queryset):
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer)
- 
-    # Create a PDF document
-    supporters = queryset.all()
- 
-    y = 790
-    for supporter in supporters:
-        p.drawString(50, y, f"{supporter.first_name} {supporter.last_name}")
-        p.drawString(50, y - 20, f"{supporter.street_name} {supporter.address_number} {supporter.bus if supporter.bus is not None else ''}")
-        p.drawString(50, y - 40, f"{supporter.postcode} {supporter.city}")
-        p.drawString(50, y - 60, supporter.country)
-        y -= 100
- 
-    p.showPage()
-    p.save()
- 
-    buffer.seek(0)
-    return buffer
+def generateAddressListFile(queryset, sheet="list"):
+    return labels.generate_labels(queryset, labels.LABEL_SHEETS[sheet])
+
+
+# exports
+def generateExport(modeladmin, request, queryset, file_format):
+    amount = queryset.count()
+
+    # big selections are written by a celery task, the user gets a mail with the download link
+    if amount > exports.BACKGROUND_THRESHOLD:
+        from ..tasks import export_selection
+
+        # only the token goes to the task, the ids of the selection stay on the server
+        token = exports.create_selection(request.user, queryset)
+        url = request.build_absolute_uri(reverse('admin:download_export', args=[token]))
+        export_selection.delay(request.user.pk, token, file_format, url)
+
+        return messages.info(request, _(f"The export of {amount} rows is being prepared, you will get an email with the download link."))
+
+    # the rows are streamed while they are read from the database
+    response = StreamingHttpResponse(exports.stream_export(queryset.model, exports.iter_rows(queryset), file_format), content_type=exports.CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{exports.get_filename(queryset.model, file_format)}"'
+    return response
 
 
 def percentage_change(a, b):
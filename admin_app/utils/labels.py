@@ -0,0 +1,86 @@
+from tempfile import SpooledTemporaryFile
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+
+# PDFs bigger than this are spooled to a temporary file instead of kept in memory
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+ADDRESS_FIELDS = ('first_name', 'last_name', 'street_name', 'address_number', 'bus', 'postcode', 'city', 'country')
+
+
+class LabelSheet:
+    """Layout of a page of address labels, positions are in points"""
+
+    def __init__(self, columns, rows, label_width, label_height, margin_left=0, margin_top=0,
+                 padding=0, font_size=12, line_height=20, pagesize=A4):
+        self.columns = columns
+        self.rows = rows
+        self.label_width = label_width
+        self.label_height = label_height
+        self.margin_left = margin_left
+        self.margin_top = margin_top
+        self.padding = padding
+        self.font_size = font_size
+        self.line_height = line_height
+        self.pagesize = pagesize
+
+    @property
+    def labels_per_page(self):
+        return self.columns * self.rows
+
+    def get_position(self, index):
+        # top left corner of the label text, labels are filled row by row
+        row, column = divmod(index % self.labels_per_page, self.columns)
+        x = self.margin_left + column * self.label_width + self.padding
+        y = self.pagesize[1] - self.margin_top - row * self.label_height - self.padding
+        return x, y
+
+
+LABEL_SHEETS = {
+    # one address below the other, like the list that was always printed
+    "list": LabelSheet(columns=1, rows=8, label_width=A4[0], label_height=100, margin_left=50, margin_top=40),
+    # A4 sticker sheets with 3 x 8 labels of 70 x 37 mm
+    "a4-3x8": LabelSheet(
+        columns=3, rows=8, label_width=70 * mm, label_height=A4[1] / 8,
+        padding=5 * mm, font_size=9, line_height=11,
+    ),
+}
+
+
+def get_address_lines(supporter):
+    return [
+        f"{supporter['first_name']} {supporter['last_name']}",
+        f"{supporter['street_name']} {supporter['address_number']} {supporter['bus'] if supporter['bus'] is not None else ''}",
+        f"{supporter['postcode']} {supporter['city']}",
+        supporter['country'],
+    ]
+
+
+def generate_labels(queryset, sheet):
+    """
+    Draw an address label for every supporter of the queryset, starting a new page when one is full.
+    The supporters are fetched in chunks and the PDF goes to a temporary file once it gets large.
+    """
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    p = canvas.Canvas(output, pagesize=sheet.pagesize, pageCompression=1)
+    p.setFont("Helvetica", sheet.font_size)
+
+    supporters = queryset.prefetch_related(None).values(*ADDRESS_FIELDS).iterator(chunk_size=2000)
+
+    for index, supporter in enumerate(supporters):
+        if index and index % sheet.labels_per_page == 0:
+            p.showPage()
+            p.setFont("Helvetica", sheet.font_size)
+
+        x, y = sheet.get_position(index)
+        for line_number, line in enumerate(get_address_lines(supporter)):
+            p.drawString(x, y - sheet.font_size - line_number * sheet.line_height, line)
+
+    p.showPage()
+    p.save()
+
+    output.seek(0)
+    return output
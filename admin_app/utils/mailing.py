@@ -0,0 +1,90 @@
+import secrets
+
+from django.apps import apps
+from django.core.cache import cache
+
+
+# how long a generated mailing list stays available
+MAILING_LIST_TIMEOUT = 60 * 60
+
+MAX_EMAILS_PER_BATCH = 50
+
+
+def create_mailing_list(user, queryset):
+    """Store the selected supporters server side and return the token to fetch them again"""
+    token = secrets.token_urlsafe(16)
+    # in a fixed order, the batches are cut from this list
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000))
+
+    cache.set(f"mailing_list:{token}", {
+        "user_id": user.pk,
+        "model": queryset.model._meta.label,
+        "ids": ids,
+    }, timeout=MAILING_LIST_TIMEOUT)
+
+    return token
+
+
+def get_mailing_list(user, token):
+    mailing_list = cache.get(f"mailing_list:{token}")
+    if mailing_list is None or mailing_list["user_id"] != user.pk:
+        return None
+
+    return mailing_list
+
+
+def iter_recipients(mailing_list, fields=('first_name', 'last_name', 'mail')):
+    """
+    The recipients of the mailing list in the order of the stored ids, without empty or
+    duplicate email addresses. Every call gives the same order, so batches don't overlap.
+    """
+    model = apps.get_model(mailing_list["model"])
+    ids = mailing_list["ids"]
+    seen = set()
+
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start:start + 1000]
+        recipients = {recipient['pk']: recipient for recipient in model.objects.filter(pk__in=chunk).values('pk', *fields)}
+        for pk in chunk:
+            # supporters that were deleted in the meantime
+            recipient = recipients.get(pk)
+            if recipient is None:
+                continue
+
+            mail = (recipient['mail'] or '').strip()
+            if not mail or mail.lower() in seen:
+                continue
+
+            seen.add(mail.lower())
+            yield recipient
+
+
+def iter_mails(mailing_list):
+    for recipient in iter_recipients(mailing_list, fields=('mail',)):
+        yield recipient['mail'].strip()
+
+
+def get_batch(mailing_list, batch):
+    """Email addresses of the batch with the given (0 based) index"""
+    start = batch * MAX_EMAILS_PER_BATCH
+    mails = []
+
+    for index, mail in enumerate(iter_mails(mailing_list)):
+        if index >= start + MAX_EMAILS_PER_BATCH:
+            break
+        if index >= start:
+            mails.append(mail)
+
+    return mails
+
+
+def format_vcard(recipient):
+    first_name, last_name = recipient['first_name'], recipient['last_name']
+    return (
+        "BEGIN:VCARD\r\n"
+        "VERSION:3.0\r\n"
+        f"N:{last_name};{first_name};;;\r\n"
+        f"FN:{first_name} {last_name}\r\n"
+        f"EMAIL;TYPE=INTERNET:{recipient['mail'].strip()}\r\n"
+        "END:VCARD\r\n"
+    )
@@ -0,0 +1,50 @@
+from collections import Counter
+from datetime import date
+
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
+
+from ..models import Adoption, AdoptionParentSponsoring
+from . import badges, search, snapshot, yearly_totals
+
+
+def generate_yearly_payments(parents=None, user=None, day=None):
+    """
+    Add an empty payment for every active adoption of the (given) active adoption parents.
+    Adoptions that already have a payment in that year are skipped, so running it twice is safe.
+    Returns the amount of created and skipped payments.
+    """
+    day = day or date.today()
+
+    adoptions = Adoption.objects.filter(active=True, adoptionparent__active=True)
+    if parents is not None:
+        adoptions = adoptions.filter(adoptionparent__in=parents)
+
+    with transaction.atomic():
+        # lock the adoptions so concurrent runs can't both create the same payment
+        pairs = set(adoptions.select_for_update(of=('self',)).values_list('adoptionparent_id', 'child_id'))
+
+        existing = set(AdoptionParentSponsoring.objects.filter(
+            date__year=day.year,
+            parent_id__in={parent_id for parent_id, _ in pairs},
+        ).values_list('parent_id', 'child_id'))
+
+        new_payments = [
+            AdoptionParentSponsoring(date=day, amount=0, parent_id=parent_id, child_id=child_id)
+            for parent_id, child_id in sorted(pairs - existing)
+        ]
+        bulk_create_with_history(new_payments, AdoptionParentSponsoring, default_user=user)
+
+        # bulk_create doesn't send the signals that keep the yearly totals up to date
+        for parent_id, amount in Counter(payment.parent_id for payment in new_payments).items():
+            yearly_totals.apply_change(yearly_totals.get_key(AdoptionParentSponsoring, day, parent_id), 0, amount)
+
+        # nor the ones that keep the search vectors up to date
+        search.update_search_vectors(AdoptionParentSponsoring, pk__in=[payment.pk for payment in new_payments])
+
+        # or invalidate the dashboard and the badges
+        if new_payments:
+            transaction.on_commit(lambda: snapshot.invalidate("dashboard"))
+            transaction.on_commit(badges.changed)
+
+    return len(new_payments), len(pairs & existing)
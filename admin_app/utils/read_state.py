@@ -0,0 +1,206 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import BooleanField, Count, Exists, ExpressionWrapper, Func, IntegerField, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import AdoptionParent, AdoptionParentSponsoring, Child, Donation, ReadWatermark, Sponsor, UserView
+from . import badges
+
+
+# models that have a last_updated field and a badge in the sidebar
+TRACKED_MODELS = (Child, AdoptionParent, AdoptionParentSponsoring, Sponsor, Donation)
+
+# the watermark stays this far behind now: an object saved in a transaction that is still open
+# gets a last_updated before its commit, the watermark must not pass it before it is visible
+WATERMARK_MARGIN = timedelta(minutes=5)
+
+# The read state of a user is stored per model as a watermark: everything last updated before
+# seen_until has been seen. UserView only keeps the exceptions to it, objects that were viewed
+# after the watermark (last_viewed is set) or marked as unread below it (last_viewed is empty).
+
+
+def read_condition(model, user):
+    """
+    Q object that is true for the objects of the model the user has seen.
+    user can also be an OuterRef, to evaluate it for every user of an outer query.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    exceptions = UserView.objects.filter(user=user, content_type=content_type, object_id=OuterRef('pk'))
+    watermark = ReadWatermark.objects.filter(user=user, content_type=content_type, seen_until__gt=OuterRef('last_updated'))
+
+    # an exception always wins from the watermark
+    return (
+        Q(Exists(exceptions.filter(last_viewed__gte=OuterRef('last_updated'))))
+        | (Q(Exists(watermark)) & ~Q(Exists(exceptions)))
+    )
+
+
+def unread_queryset(model, user):
+    """All objects of the model that were changed since the user last viewed them"""
+    return model.objects.filter(~read_condition(model, user))
+
+
+def annotate_unread(queryset, user):
+    """Add an is_unread flag to every object, so changelists can show, sort and filter on it"""
+    return queryset.annotate(
+        is_unread=ExpressionWrapper(~read_condition(queryset.model, user), output_field=BooleanField()),
+    )
+
+
+def unread_counts(user, models=TRACKED_MODELS):
+    """
+    Amount of unread objects per model for the user, computed with one query:
+    an anti-join per model, glued together with UNION ALL.
+    """
+    querysets = [
+        unread_queryset(model, user)
+        .order_by()
+        .annotate(model_label=Value(model._meta.label_lower))
+        .values('model_label')
+        .annotate(amount=Count('pk'))
+        .values_list('model_label', 'amount')
+        for model in models
+    ]
+
+    counts = dict(querysets[0].union(*querysets[1:], all=True))
+    return {model: counts.get(model._meta.label_lower, 0) for model in models}
+
+
+def count_subquery(queryset):
+    return Coalesce(
+        Subquery(queryset.order_by().annotate(object_count=Func('pk', function='COUNT')).values('object_count')[:1]),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def unread_counts_for_users(users, models=TRACKED_MODELS):
+    """
+    Amount of unread objects per model for every user: {user_id: {model: amount}}.
+    Uses a single query over the users with a counting subquery per model.
+    """
+    counts = users.order_by().annotate(**{
+        model._meta.model_name: count_subquery(unread_queryset(model, OuterRef(OuterRef('pk'))))
+        for model in models
+    }).values('pk', *(model._meta.model_name for model in models))
+
+    return {
+        row['pk']: {model: row[model._meta.model_name] for model in models}
+        for row in counts
+    }
+
+
+def mark_viewed(user, model, object_id):
+    """Remember that the user has seen the current version of a single object"""
+    UserView.objects.bulk_create(
+        [UserView(user=user, content_type=ContentType.objects.get_for_model(model), object_id=object_id, last_viewed=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['user', 'content_type', 'object_id'],
+        update_fields=['last_viewed'],
+    )
+    transaction.on_commit(lambda: badges.changed(user.pk))
+
+
+def mark_read(user, queryset):
+    """
+    Mark all unread objects of the queryset as read with a single upsert and fold the
+    exceptions into the watermark again. Returns the amount of objects that were unread.
+    """
+    model = queryset.model
+    content_type = ContentType.objects.get_for_model(model)
+    now = timezone.now()
+
+    user_views = [
+        UserView(user=user, content_type=content_type, object_id=pk, last_viewed=now)
+        for pk in queryset.filter(~read_condition(model, user)).order_by().values_list('pk', flat=True).iterator(chunk_size=1000)
+    ]
+    UserView.objects.bulk_create(
+        user_views,
+        update_conflicts=True,
+        unique_fields=['user', 'content_type', 'object_id'],
+        update_fields=['last_viewed'],
+        batch_size=1000,
+    )
+
+    compact(user, model)
+    transaction.on_commit(lambda: badges.changed(user.pk))
+    return len(user_views)
+
+
+def mark_unread(user, queryset):
+    """
+    Mark all read objects of the queryset as unread, returns the amount of objects.
+    Below the watermark this needs an exception with an empty last_viewed.
+    """
+    model = queryset.model
+    content_type = ContentType.objects.get_for_model(model)
+
+    user_views = [
+        UserView(user=user, content_type=content_type, object_id=pk, last_viewed=None)
+        for pk in queryset.filter(read_condition(model, user)).order_by().values_list('pk', flat=True).iterator(chunk_size=1000)
+    ]
+    UserView.objects.bulk_create(
+        user_views,
+        update_conflicts=True,
+        unique_fields=['user', 'content_type', 'object_id'],
+        update_fields=['last_viewed'],
+        batch_size=1000,
+    )
+
+    compact(user, model)
+    transaction.on_commit(lambda: badges.changed(user.pk))
+    return len(user_views)
+
+
+def compact(user, model):
+    """
+    Move the watermark of the user up to the oldest object that is still unread and
+    delete the exceptions that say the same as the new watermark.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    safe_until = timezone.now() - WATERMARK_MARGIN
+    exceptions = UserView.objects.filter(user=user, content_type=content_type)
+
+    with transaction.atomic():
+        # objects with an exception don't hold the watermark back, the exception keeps deciding for them.
+        # Without one, an object is only read when it is below the current watermark, so it can't move back.
+        oldest_unread = model.objects.filter(
+            ~Exists(exceptions.filter(object_id=OuterRef('pk'))),
+            ~Exists(ReadWatermark.objects.filter(user=user, content_type=content_type, seen_until__gt=OuterRef('last_updated'))),
+        ).aggregate(oldest=Min('last_updated'))['oldest']
+        seen_until = min(oldest_unread, safe_until) if oldest_unread is not None else safe_until
+
+        # the watermark never moves back, everything below it stays read
+        current = ReadWatermark.objects.filter(user=user, content_type=content_type).values_list('seen_until', flat=True).first()
+        if current is not None:
+            seen_until = max(seen_until, current)
+
+        ReadWatermark.objects.update_or_create(user=user, content_type=content_type, defaults={'seen_until': seen_until})
+
+        objects = model.objects.filter(pk=OuterRef('object_id'))
+        below = objects.filter(last_updated__lt=seen_until)
+        above = objects.filter(last_updated__gte=seen_until)
+        deleted, _ = exceptions.filter(
+            Q(Exists(below.filter(last_updated__lte=OuterRef('last_viewed'))))
+            | Q(Exists(above.filter(last_updated__gt=OuterRef('last_viewed'))))
+            | (Q(last_viewed__isnull=True) & Q(Exists(above)))
+            # exceptions of deleted objects
+            | ~Q(Exists(objects))
+        ).delete()
+
+    return deleted
+
+
+def compact_all(models=TRACKED_MODELS):
+    """Compact the read state of every user that has exceptions, returns the amount of deleted rows"""
+    deleted = 0
+    for model in models:
+        content_type = ContentType.objects.get_for_model(model)
+        for user in User.objects.filter(userview__content_type=content_type).distinct():
+            deleted += compact(user, model)
+
+    return deleted
@@ -0,0 +1,133 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest
+
+
+CONFIG = 'simple'
+
+# the fields that make up the search vector of a model, per weight (A ranks highest).
+# Fields of related objects are glued together in a subquery, so the vector can be set with an update
+SEARCH_FIELDS = {
+    'adoptionparent': {
+        'A': ('first_name', 'last_name', 'firm'),
+        'B': ('mail', 'phone_number', 'street_name', 'address_number', 'bus', 'postcode', 'city', 'country', 'children__name'),
+        'C': ('description', 'children__description'),
+    },
+    'child': {
+        'A': ('name',),
+        'B': (
+            'adoptionparent__first_name', 'adoptionparent__last_name', 'adoptionparent__firm', 'adoptionparent__mail',
+            'adoptionparent__phone_number', 'adoptionparent__street_name', 'adoptionparent__postcode',
+            'adoptionparent__city', 'adoptionparent__country',
+        ),
+        'C': ('description', 'link_website', 'adoptionparent__description'),
+    },
+    'adoptionparentsponsoring': {
+        'A': ('parent__first_name', 'parent__last_name', 'parent__firm', 'child__name'),
+        'B': (
+            'date', 'amount', 'parent__mail', 'parent__phone_number', 'parent__street_name', 'parent__postcode',
+            'parent__city', 'parent__country',
+        ),
+        'C': ('description', 'parent__description'),
+    },
+}
+
+# names that are also matched on similarity, so typos still find them
+TRIGRAM_FIELDS = {
+    'adoptionparent': ('first_name', 'last_name'),
+    'child': ('name',),
+    'adoptionparentsponsoring': ('parent__first_name', 'parent__last_name', 'child__name'),
+}
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def joined_text(model, fields):
+    """Subquery with the fields of all objects related to the outer object as one string"""
+    parts = []
+    for field in fields:
+        parts += [field, Value(' ')]
+    text = Concat(*parts[:-1], output_field=TextField()) if len(fields) > 1 else Cast(fields[0], TextField())
+
+    return Coalesce(
+        Subquery(
+            model._default_manager.filter(pk=OuterRef('pk')).order_by().values('pk')
+            .annotate(text=StringAgg(text, ' '))
+            .values('text')
+        ),
+        Value(''),
+        output_field=TextField(),
+    )
+
+
+def get_vector(model):
+    vector = None
+    for weight, fields in SEARCH_FIELDS[model._meta.model_name].items():
+        local_fields = [field for field in fields if '__' not in field]
+        joined_fields = [field for field in fields if '__' in field]
+
+        expressions = local_fields + ([joined_text(model, joined_fields)] if joined_fields else [])
+        weighted = SearchVector(*expressions, weight=weight, config=CONFIG)
+        vector = weighted if vector is None else vector + weighted
+
+    return vector
+
+
+def update_search_vectors(model, **filters):
+    """
+    Recompute the search vector of the (filtered) objects of the model with a single update.
+    Also works with the historical models of a migration.
+    """
+    if not is_supported():
+        return 0
+
+    return model._default_manager.filter(**filters).update(search_vector=get_vector(model))
+
+
+def update_related_search_vectors(instance):
+    """Update the search vectors of the object and of all objects that show its fields in their own vector"""
+    from ..models import Adoption, AdoptionParent, AdoptionParentSponsoring, Child
+
+    if isinstance(instance, AdoptionParent):
+        update_search_vectors(AdoptionParent, pk=instance.pk)
+        update_search_vectors(Child, adoptionparent=instance.pk)
+        update_search_vectors(AdoptionParentSponsoring, parent=instance.pk)
+
+    elif isinstance(instance, Child):
+        update_search_vectors(Child, pk=instance.pk)
+        update_search_vectors(AdoptionParent, children=instance.pk)
+        update_search_vectors(AdoptionParentSponsoring, child=instance.pk)
+
+    elif isinstance(instance, Adoption):
+        update_search_vectors(AdoptionParent, pk=instance.adoptionparent_id)
+        update_search_vectors(Child, pk=instance.child_id)
+
+    elif isinstance(instance, AdoptionParentSponsoring):
+        update_search_vectors(AdoptionParentSponsoring, pk=instance.pk)
+
+
+def get_query(search_term):
+    # every word is matched as a prefix, quoted so the words can't be read as tsquery operators
+    words = [word.replace('\\', '\\\\').replace("'", "''") for word in search_term.split()]
+    return SearchQuery(' & '.join(f"'{word}':*" for word in words), search_type='raw', config=CONFIG)
+
+
+def search(queryset, search_term):
+    """Filter the queryset on the search term and annotate a search_rank to order the results on"""
+    query = get_query(search_term)
+    trigram_fields = TRIGRAM_FIELDS[queryset.model._meta.model_name]
+
+    condition = Q(search_vector=query)
+    for field in trigram_fields:
+        condition |= Q(**{f"{field}__trigram_word_similar": search_term})
+
+    similarities = [TrigramWordSimilarity(search_term, field) for field in trigram_fields]
+    similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+    return queryset.filter(condition).annotate(
+        search_rank=SearchRank(F('search_vector'), query) + similarity,
+    )
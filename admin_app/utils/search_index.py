@@ -0,0 +1,118 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from unfold.dataclasses import SearchResult
+
+from ..models import SearchDocument
+
+
+# models that get a search document, with the icon they have in the sidebar
+INDEXED_MODELS = {
+    'admin_app.Child': "sentiment_very_satisfied",
+    'admin_app.AdoptionParent': "escalator_warning",
+    'admin_app.Sponsor': "patient_list",
+    'events.Participant': "person",
+    'events.Payment': "payments",
+}
+
+MAX_RESULTS = 10
+
+
+def normalize(value):
+    return " ".join((value or "").lower().split())
+
+
+def is_indexed(model):
+    return model._meta.label in INDEXED_MODELS
+
+
+def get_document_fields(instance):
+    """The values of the search document of the instance"""
+    if instance._meta.model_name == 'child':
+        names = [instance.name]
+    else:
+        names = [instance.first_name or "", instance.last_name or ""]
+
+    mail = getattr(instance, 'mail', None) or ""
+    details = [str(instance._meta.verbose_name), mail, getattr(instance, 'city', None) or ""]
+
+    return {
+        'title': (" ".join(name for name in names if name) or mail or str(instance.pk))[:200],
+        'description': " · ".join(detail for detail in details if detail)[:200],
+        'name': normalize(" ".join(names))[:110],
+        'reversed_name': normalize(" ".join(reversed(names)))[:110],
+        'mail': normalize(mail)[:254],
+        'postcode': normalize(getattr(instance, 'postcode', None))[:15],
+    }
+
+
+def update_document(instance):
+    SearchDocument.objects.update_or_create(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        defaults=get_document_fields(instance),
+    )
+
+
+def create_documents(instances):
+    """Search documents for new objects that were created with bulk_create, which sends no signals"""
+    SearchDocument.objects.bulk_create([
+        SearchDocument(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk, **get_document_fields(instance))
+        for instance in instances
+    ], batch_size=1000)
+
+
+def delete_document(instance):
+    SearchDocument.objects.filter(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk).delete()
+
+
+def rebuild():
+    """Recreate all search documents, returns the amount of documents"""
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+
+        amount = 0
+        for label in INDEXED_MODELS:
+            model = apps.get_model(label)
+            content_type = ContentType.objects.get_for_model(model)
+            documents = SearchDocument.objects.bulk_create((
+                SearchDocument(content_type=content_type, object_id=instance.pk, **get_document_fields(instance))
+                for instance in model.objects.iterator(chunk_size=2000)
+            ), batch_size=1000)
+            amount += len(documents)
+
+    return amount
+
+
+def search(user, search_term, limit=MAX_RESULTS):
+    """The best matching search documents of all models the user can view, in a single query"""
+    term = normalize(search_term)
+    if not term:
+        return SearchDocument.objects.none()
+
+    content_types = [
+        ContentType.objects.get_for_model(model)
+        for model in map(apps.get_model, INDEXED_MODELS)
+        if user.has_perm(f"{model._meta.app_label}.view_{model._meta.model_name}")
+    ]
+
+    return SearchDocument.objects.filter(
+        Q(name__startswith=term) | Q(reversed_name__startswith=term) | Q(mail__startswith=term) | Q(postcode__startswith=term),
+        content_type__in=content_types,
+    ).order_by('name', 'pk')[:limit]
+
+
+def search_callback(request, search_term):
+    results = []
+    for document in search(request.user, search_term):
+        content_type = ContentType.objects.get_for_id(document.content_type_id)
+        results.append(SearchResult(
+            title=document.title,
+            description=document.description,
+            link=reverse(f"admin:{content_type.app_label}_{content_type.model}_change", args=(document.object_id,)),
+            icon=INDEXED_MODELS[content_type.model_class()._meta.label],
+        ))
+
+    return results
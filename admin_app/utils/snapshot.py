@@ -0,0 +1,54 @@
+import uuid
+
+from django.core.cache import cache
+
+
+# how long a worker may hold the right to recompute a snapshot
+LOCK_TIMEOUT = 30
+
+
+def get_version(name):
+    version = cache.get(f"snapshot:{name}:version")
+    if version is None:
+        cache.add(f"snapshot:{name}:version", uuid.uuid4().hex, timeout=None)
+        version = cache.get(f"snapshot:{name}:version")
+
+    return version
+
+
+def invalidate(name):
+    # the old snapshot is kept, so it can still be served while a new one is computed
+    cache.set(f"snapshot:{name}:version", uuid.uuid4().hex, timeout=None)
+
+
+def refresh(name, compute):
+    version = get_version(name)
+    data = compute()
+    cache.set(f"snapshot:{name}", (version, data), timeout=None)
+    return data
+
+
+def get_or_refresh(name, compute):
+    """
+    Return the cached result of compute(), recomputing it when it was invalidated.
+    Only one worker recomputes at a time, the others serve the stale result meanwhile.
+    """
+    version = get_version(name)
+    snapshot = cache.get(f"snapshot:{name}")
+
+    if snapshot is not None and snapshot[0] == version:
+        return snapshot[1]
+
+    if cache.add(f"snapshot:{name}:lock", 1, timeout=LOCK_TIMEOUT):
+        try:
+            data = compute()
+            cache.set(f"snapshot:{name}", (version, data), timeout=None)
+        finally:
+            cache.delete(f"snapshot:{name}:lock")
+        return data
+
+    # someone else is recomputing
+    if snapshot is not None:
+        return snapshot[1]
+
+    return compute()
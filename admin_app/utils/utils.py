@@ -1,40 +1,30 @@
-from django.http import HttpRequest
 from django.utils.translation import gettext_lazy as _
 
 from ..models import *
+from . import badges, read_state
 
 
 def badge_callback(request, model) -> str:
 
-    # request can also be the user itself in case of the celery task
-    try:
-        user = request.user
-    except:
-        user = request
-
     # Ensure we have a valid user
-    if not user.is_authenticated:
+    if not request.user.is_authenticated:
         return ""
 
-    # Get all UserView objects for the current user
-    user_views = UserView.objects.filter(
-        user=user,
-        content_type=ContentType.objects.get_for_model(model)
-    )
+    amount_unread = get_unread_counts(request)[model]
+    return f"{amount_unread}" if amount_unread > 0 else ""
+
 
-    all_objects = model.objects.all()
+def get_unread_counts(request):
+    # the sidebar renders five badges per page, so the counts are remembered on the request
+    if not hasattr(request, '_unread_counts'):
+        request._unread_counts = get_unread_counts_for_user(request.user)
 
-    amount_of_read_objects = 0
+    return request._unread_counts
 
-    # Filter out objects where last_updated is later than last_viewed for each content_object_id
-    for user_view in user_views:
-        amount_of_read_objects += all_objects.filter(
-            id=user_view.object_id,
-            last_updated__lte=user_view.last_viewed
-        ).count()
 
-    amount_unread = all_objects.count() - amount_of_read_objects
-    return f"{amount_unread}" if amount_unread > 0 else ""
+def get_unread_counts_for_user(user):
+    # the counts of all models are computed together and cached until something changes
+    return badges.get_counts(user, read_state.unread_counts)
 
 
 
@@ -0,0 +1,75 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from ..models import AdoptionParentSponsoring, Donation, YearlyTotal, YearlyTotalKindChoices
+
+
+# model: (kind, field pointing to the supporter)
+SOURCES = {
+    Donation: (YearlyTotalKindChoices.DONATION, 'sponsor_id'),
+    AdoptionParentSponsoring: (YearlyTotalKindChoices.ADOPTION_PARENT_PAYMENT, 'parent_id'),
+}
+
+
+def get_key(model, date, supporter_id):
+    kind, _ = SOURCES[model]
+    return date.year, kind, supporter_id
+
+
+def get_instance_key(instance):
+    _, supporter_field = SOURCES[type(instance)]
+    return get_key(type(instance), instance.date, getattr(instance, supporter_field))
+
+
+def apply_change(key, amount, count):
+    """Add amount and count to the yearly total of key, creating it when needed"""
+    year, kind, supporter_id = key
+    totals = YearlyTotal.objects.filter(year=year, kind=kind, supporter_id=supporter_id)
+
+    if totals.update(amount=F('amount') + amount, count=F('count') + count):
+        if count < 0:
+            totals.filter(count=0).delete()
+        return
+
+    try:
+        with transaction.atomic():
+            YearlyTotal.objects.create(year=year, kind=kind, supporter_id=supporter_id, amount=amount, count=count)
+    except IntegrityError:
+        # created by a concurrent transaction in the meantime
+        totals.update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def compute_totals():
+    """The yearly totals computed from scratch out of the raw tables"""
+    totals = {}
+    for model, (kind, supporter_field) in SOURCES.items():
+        rows = model.objects.order_by().values_list('date__year', supporter_field).annotate(Sum('amount'), Count('pk'))
+        for year, supporter_id, amount, count in rows:
+            totals[(year, kind, supporter_id)] = (amount, count)
+
+    return totals
+
+
+def rebuild():
+    with transaction.atomic():
+        YearlyTotal.objects.all().delete()
+        YearlyTotal.objects.bulk_create([
+            YearlyTotal(year=year, kind=kind, supporter_id=supporter_id, amount=amount, count=count)
+            for (year, kind, supporter_id), (amount, count) in compute_totals().items()
+        ], batch_size=1000)
+
+
+def find_differences():
+    """Keys of which the stored yearly total doesn't match the raw tables"""
+    expected = compute_totals()
+    stored = {
+        (total.year, total.kind, total.supporter_id): (total.amount, total.count)
+        for total in YearlyTotal.objects.all()
+    }
+
+    return sorted(
+        key for key in expected.keys() | stored.keys()
+        if key not in expected or key not in stored
+        or stored[key][1] != expected[key][1]
+        or abs(stored[key][0] - expected[key][0]) > 0.005
+    )
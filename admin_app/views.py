@@ -1,9 +1,16 @@
+import csv
+import itertools
 import json
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.utils.html import escape
+import math
+import os
+from urllib.parse import quote, urlencode
+from django.core.files.storage import storages
+from django.db.models import Count, Sum
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import reverse
 from django.utils.translation import gettext as _
 from .utils.helper import percentage_change
+from .utils import badges, exports, mailing, snapshot
 import datetime
 
 from django.utils.safestring import mark_safe
@@ -12,36 +19,63 @@ from .utils.helper import *
 
 
 
+def get_dashboard_data():
+    from .models import Child, AdoptionParent, StatusChoices, YearlyTotal, YearlyTotalKindChoices
+
+    # every figure comes from one grouped query, so the amount of queries
+    # stays the same no matter how many years of data there are.
+    # The income is read from the yearly totals instead of every single transaction
+    donations_by_year = dict(
+        YearlyTotal.objects.filter(kind=YearlyTotalKindChoices.DONATION)
+        .order_by().values_list("year").annotate(Sum("amount"))
+    )
+    parent_sponsors_by_year = dict(
+        YearlyTotal.objects.filter(kind=YearlyTotalKindChoices.ADOPTION_PARENT_PAYMENT)
+        .order_by().values_list("year").annotate(Sum("amount"))
+    )
+    children_by_admission_year = dict(
+        Child.objects.order_by().values_list("date_of_admission__year").annotate(Count("pk"))
+    )
+    children_by_status = dict(
+        Child.objects.order_by().values_list("status").annotate(Count("pk"))
+    )
+
+    return {
+        "donations_by_year": {str(year): total for year, total in donations_by_year.items()},
+        "parent_sponsors_by_year": {str(year): total for year, total in parent_sponsors_by_year.items()},
+        "children_by_admission_year": {str(year): amount for year, amount in sorted(children_by_admission_year.items())},
+        "children_by_status": {status: children_by_status.get(status, 0) for status in StatusChoices.values},
+        "amount_of_adoption_parents": AdoptionParent.objects.filter(active=True).count(),
+    }
+
+
 def dashboard_callback(request, context):
-    from .models import Donation, AdoptionParentSponsoring, Child, AdoptionParent, StatusChoices
+    from .models import StatusChoices
 
     current_year = str(datetime.datetime.now().year)
     last_year = str(datetime.datetime.now().year -1)
 
     progress_text = _(f"progress from {last_year}")
+
+    # cached, the signals in signals.py invalidate it when the underlying data changes
+    data = snapshot.get_or_refresh("dashboard", get_dashboard_data)
+    donations_by_year = data["donations_by_year"]
+    parent_sponsors_by_year = data["parent_sponsors_by_year"]
     
     # Get donations and parent sponsors in every year
-    all_years_donation = Donation.objects.all().values("date__year").order_by("date__year").distinct()
-    all_years_donation = [str(y['date__year']) for y in all_years_donation]
-    all_years_parent = AdoptionParentSponsoring.objects.all().values("date__year").order_by("date__year").distinct()
-    all_years_parent = [str(y['date__year']) for y in all_years_parent]
+    all_years_donation = sorted(donations_by_year)
+    all_years_parent = sorted(parent_sponsors_by_year)
     all_years = all_years_donation if len(all_years_donation) > len(all_years_parent) else all_years_parent # select longest years as years
-    donation_data = [Donation.objects.filter(date__year=y).aggregate(Sum("amount"))['amount__sum'] for y in all_years]
-    donation_data = [0 if val is None else val for val in donation_data]
-    parent_sponsor_data = [AdoptionParentSponsoring.objects.filter(date__year=y).aggregate(Sum("amount"))['amount__sum'] for y in all_years]
-    parent_sponsor_data = [0 if val is None else val for val in parent_sponsor_data]
+    donation_data = [donations_by_year.get(y, 0) for y in all_years]
+    parent_sponsor_data = [parent_sponsors_by_year.get(y, 0) for y in all_years]
     
     # Total amount of donations and parent sponsors this year
-    total_donations_this_year = Donation.objects.filter(date__year=current_year).aggregate(Sum("amount"))['amount__sum']
-    total_donations_this_year = total_donations_this_year if total_donations_this_year is not None else 0
-    total_parent_sponsors_this_year = AdoptionParentSponsoring.objects.filter(date__year=current_year).aggregate(Sum("amount"))['amount__sum']
-    total_parent_sponsors_this_year = total_parent_sponsors_this_year if total_parent_sponsors_this_year is not None else 0
+    total_donations_this_year = donations_by_year.get(current_year, 0)
+    total_parent_sponsors_this_year = parent_sponsors_by_year.get(current_year, 0)
 
     # Total amount of donations and parent sponsors last year
-    total_donations_last_year = Donation.objects.filter(date__year=last_year).aggregate(Sum("amount"))['amount__sum']
-    total_donations_last_year = total_donations_last_year if total_donations_last_year is not None else 0
-    total_parent_sponsors_last_year = AdoptionParentSponsoring.objects.filter(date__year=last_year).aggregate(Sum("amount"))['amount__sum']
-    total_parent_sponsors_last_year = total_parent_sponsors_last_year if total_parent_sponsors_last_year is not None else 0
+    total_donations_last_year = donations_by_year.get(last_year, 0)
+    total_parent_sponsors_last_year = parent_sponsors_by_year.get(last_year, 0)
 
     # Calculate the difference in percentage and set color (red or green for + or -)
     donations_change_percentage = int(percentage_change(total_donations_last_year, total_donations_this_year))
@@ -50,19 +84,16 @@ def dashboard_callback(request, context):
     parent_sponsor_color_percentage = "green" if parent_sponsor_change_percentage >= 0 else "red"
 
     # Calculate total amount of active children and active adoption parents
-    amount_of_active_children = Child.objects.filter(status='a').count()
-    amount_of_adoption_parents = AdoptionParent.objects.filter(active=True).count()
-
-    # Get years of admission dates of children
-    all_years_admission = Child.objects.all().values("date_of_admission__year").order_by("date_of_admission__year").distinct()
-    all_years_admission = [str(y['date_of_admission__year']) for y in all_years_admission]
+    amount_of_active_children = data["children_by_status"][StatusChoices.ACTIVE]
+    amount_of_adoption_parents = data["amount_of_adoption_parents"]
 
     # Get amount of children by admission year
-    children_admission_data = [Child.objects.filter(date_of_admission__year=y).count() for y in all_years_admission]
+    all_years_admission = list(data["children_by_admission_year"])
+    children_admission_data = list(data["children_by_admission_year"].values())
 
     # Get amount of children by status
     children_statusses = [str(l) for l in StatusChoices.labels]
-    children_status_data = [Child.objects.filter(status=s).count() for s in StatusChoices.values]
+    children_status_data = list(data["children_by_status"].values())
 
 
     # add data to context to be able to build the dashboard
@@ -154,29 +185,32 @@ def dashboard_callback(request, context):
     return context
 
 
-def generate_mailto_link(request):
-    # Get email addresses from the query parameters
-    email_addresses = request.GET.get('emails', '')
-    
-    # Escape email addresses to ensure safety
-    escaped_emails = escape(email_addresses)
-    
-    # Split email addresses into a list
-    email_list = escaped_emails.split(',')
-    
-    # Define a maximum number of addresses per mailto link
-    MAX_EMAILS_PER_LINK = 50
-    
-    # Split the email addresses into smaller groups
-    email_groups = [email_list[i:i + MAX_EMAILS_PER_LINK] for i in range(0, len(email_list), MAX_EMAILS_PER_LINK)]
-    
-    # Generate buttons for each batch of email links
+class HttpResponseMailtoRedirect(HttpResponseRedirect):
+    allowed_schemes = ['mailto']
+
+
+def generate_mailto_link(request, token):
+    # The selected recipients are stored server side, only the token is passed around
+    mailing_list = mailing.get_mailing_list(request.user, token)
+    if mailing_list is None:
+        raise Http404(_("This mailing list has expired, please generate it again."))
+
+    amount_of_emails = sum(1 for _mail in mailing.iter_mails(mailing_list))
+    amount_of_batches = math.ceil(amount_of_emails / mailing.MAX_EMAILS_PER_BATCH)
+
+    # Generate buttons for each batch of email links, a batch is only fetched when its button is clicked
     buttons_html = ""
-    for i, group in enumerate(email_groups):
-        mailto_link = f"mailto:{','.join(group)}?subject=Important Information&body=Please review the following information."
+    for i in range(amount_of_batches):
+        batch_url = reverse('admin:mailing_list_batch', args=[token, i])
         buttons_html += f"""
-        <button onclick="window.open('{mailto_link}', '_blank')">Open Batch {i + 1}</button><br>
+        <button onclick="window.open('{batch_url}', '_blank')">Open Batch {i + 1}</button><br>
         """
+
+    csv_url = reverse('admin:download_mailing_list', args=[token, 'csv'])
+    vcard_url = reverse('admin:download_mailing_list', args=[token, 'vcf'])
+    buttons_html += f"""
+        <p>{amount_of_emails} email addresses, <a href="{csv_url}">download as CSV</a> or <a href="{vcard_url}">as vCard</a></p>
+    """
     
     # Generate the HTML content
     html_content = f"""
@@ -218,3 +252,82 @@ def generate_mailto_link(request):
     return HttpResponse(html_content, content_type='text/html')
 
 
+def mailing_list_batch(request, token, batch):
+    mailing_list = mailing.get_mailing_list(request.user, token)
+    if mailing_list is None:
+        raise Http404(_("This mailing list has expired, please generate it again."))
+
+    email_list = mailing.get_batch(mailing_list, batch)
+    if not email_list:
+        raise Http404()
+
+    query_string = urlencode({'subject': 'Important Information', 'body': 'Please review the following information.'}, quote_via=quote)
+    return HttpResponseMailtoRedirect(f"mailto:{','.join(quote(mail, safe='@') for mail in email_list)}?{query_string}")
+
+
+def download_mailing_list(request, token, file_format):
+    mailing_list = mailing.get_mailing_list(request.user, token)
+    if mailing_list is None:
+        raise Http404(_("This mailing list has expired, please generate it again."))
+
+    recipients = mailing.iter_recipients(mailing_list)
+
+    if file_format == 'csv':
+        writer = csv.writer(exports.Echo())
+        rows = itertools.chain(
+            [writer.writerow(['first_name', 'last_name', 'mail'])],
+            (writer.writerow([r['first_name'], r['last_name'], r['mail'].strip()]) for r in recipients),
+        )
+        response = StreamingHttpResponse(rows, content_type='text/csv')
+
+    elif file_format == 'vcf':
+        response = StreamingHttpResponse((mailing.format_vcard(r) for r in recipients), content_type='text/vcard')
+
+    else:
+        raise Http404()
+
+    response['Content-Disposition'] = f'attachment; filename="mailing_list.{file_format}"'
+    return response
+
+
+def download_export(request, token):
+    # the file of an export that was written by a celery task
+    export = exports.get_export(request.user, token)
+    storage = storages["private"]
+    if export is None or not storage.exists(export["name"]):
+        raise Http404(_("This export has expired, please export it again."))
+
+    return FileResponse(storage.open(export["name"]), as_attachment=True, filename=os.path.basename(export["name"]))
+
+
+def download_certificates(request, year):
+    # the zip with the fiscal certificates of a year, they show what every donor gave
+    # (certificates imports the models, which import this module)
+    from .utils import certificates
+
+    if not request.user.has_perm('admin_app.view_donation'):
+        return HttpResponseForbidden()
+
+    name = certificates.get_zip_name(year)
+    storage = storages["private"]
+    if not storage.exists(name):
+        raise Http404(_("The fiscal certificates of this year have not been generated yet."))
+
+    return FileResponse(storage.open(name), as_attachment=True, filename=os.path.basename(name))
+
+
+
+
+async def badge_stream(request):
+    # not wrapped in admin_view, that one can't call async views
+    from .utils import read_state
+
+    user = await request.auser()
+    if not (user.is_active and user.is_staff):
+        return HttpResponseForbidden()
+
+    response = StreamingHttpResponse(badges.stream(user, read_state.unread_counts), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,6 +1,7 @@
 from io import BytesIO
 
 from django.contrib import admin
+from django.db import transaction
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
@@ -13,6 +14,7 @@ from unfold.decorators import action, display
 from admin_app.sites import saranalaya_admin_site
 
 from .models import *
+from .tasks import fulfil_payment
 
 
 # INLINES #
@@ -49,6 +51,13 @@ class EventAdmin(SimpleHistoryAdmin, ModelAdmin):
         label = _("Sold out!") if obj.is_sold_out else _("Available")
         return obj.is_sold_out, label
 
+    @display(description=_("Participants"), ordering='reserved_count')
+    def participants_count(self, obj):
+        return obj.participants_count
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_capacity()
+
 
 
 @admin.register(Participant, site=saranalaya_admin_site)
@@ -64,6 +73,7 @@ class ParticipantAdmin(SimpleHistoryAdmin, ModelAdmin):
             PaymentStatus.CANCELED: "danger",
             PaymentStatus.EXPIRED: "danger",
             PaymentStatus.FAILED: "danger",
+            PaymentStatus.REFUNDED: "danger",
         },
         header=True,
     )
@@ -122,8 +132,18 @@ class ParticipantAdmin(SimpleHistoryAdmin, ModelAdmin):
 
 @admin.register(Payment, site=saranalaya_admin_site)
 class PaymentAdmin(SimpleHistoryAdmin, ModelAdmin):
+    list_display = ('id', 'first_name', 'last_name', 'status', 'created_at', 'fulfilled_at')
+    ordering = ('-created_at',)
+    list_filter = ('status',)
     actions_detail = ["generate_ticket",]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+
+        # a payment that is marked as paid by hand gets its tickets mailed as well
+        if obj.status == PaymentStatus.PAID and obj.fulfilled_at is None:
+            transaction.on_commit(lambda: fulfil_payment.delay(obj.pk))
+
     @action(description=_("Generate Ticket"))
     def generate_ticket(modeladmin, request, object_id: int):
         p = get_object_or_404(Payment, pk=object_id)
@@ -147,4 +167,36 @@ class TicketAdmin(SimpleHistoryAdmin, ModelAdmin):
     )
     def is_sold_out(self, obj):
         label = _("Sold out!") if obj.is_sold_out else _("Available")
-        return obj.is_sold_out, label
\ No newline at end of file
+        return obj.is_sold_out, label
+
+    @display(description=_("Participants"), ordering='reserved_count')
+    def participants_count(self, obj):
+        return obj.participants_count
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_capacity()
+
+
+@admin.register(MollieNotification, site=saranalaya_admin_site)
+class MollieNotificationAdmin(ModelAdmin):
+    list_display = ('mollie_id', 'received_at', 'processed_at', 'status')
+    ordering = ('-received_at',)
+    search_fields = ('mollie_id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PaymentExpiryRun, site=saranalaya_admin_site)
+class PaymentExpiryRunAdmin(ModelAdmin):
+    list_display = ('started_at', 'duration', 'amount_of_payments', 'amount_of_participants')
+    ordering = ('-started_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0017_alter_event_titel_sub_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentExpiryRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Started At')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration (s)')),
+                ('amount_of_payments', models.PositiveIntegerField(default=0, verbose_name='Expired Payments')),
+                ('amount_of_participants', models.PositiveIntegerField(default=0, verbose_name='Released Places')),
+            ],
+            options={
+                'verbose_name': 'Payment Expiry Run',
+                'verbose_name_plural': 'Payment Expiry Runs',
+                'ordering': ['-started_at'],
+                'get_latest_by': 'started_at',
+            },
+        ),
+        migrations.AddField(
+            model_name='historicalpayment',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created At'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created At'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'created_at'], name='payment_status_created_at'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_paid_payments_fulfilled(apps, schema_editor):
+    # their tickets were already mailed when they were saved as paid
+    Payment = apps.get_model('events', 'Payment')
+    Payment.objects.filter(status='paid').update(fulfilled_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0018_payment_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MollieNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mollie_id', models.CharField(max_length=64, verbose_name='Mollie id')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Received At')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processed At')),
+                ('status', models.CharField(blank=True, max_length=10, verbose_name='Status')),
+            ],
+            options={
+                'verbose_name': 'Mollie Notification',
+                'verbose_name_plural': 'Mollie Notifications',
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='historicalpayment',
+            name='fulfilled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Fulfilled At'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='fulfilled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Fulfilled At'),
+        ),
+        migrations.AlterField(
+            model_name='historicalpayment',
+            name='mollie_id',
+            field=models.CharField(blank=True, db_index=True, null=True, verbose_name='Mollie id'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='mollie_id',
+            field=models.CharField(blank=True, db_index=True, null=True, verbose_name='Mollie id'),
+        ),
+        migrations.RunPython(mark_paid_payments_fulfilled, migrations.RunPython.noop),
+    ]
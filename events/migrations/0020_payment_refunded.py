@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0019_mollie_notifications'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historicalpayment',
+            name='status',
+            field=models.CharField(choices=[('paid', 'Paid'), ('open', 'Open'), ('canceled', 'Canceled'), ('expired', 'Expired'), ('failed', 'Failed'), ('refunded', 'Refunded')], default='open', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('paid', 'Paid'), ('open', 'Open'), ('canceled', 'Canceled'), ('expired', 'Expired'), ('failed', 'Failed'), ('refunded', 'Refunded')], default='open', max_length=10),
+        ),
+    ]
@@ -12,7 +12,7 @@ from django.utils.translation import pgettext_lazy
 from django.contrib.staticfiles import finders
 from django.core.mail import EmailMessage
 from django.db import models
-from django.db.models import Q
+from django.db.models import Count, Exists, F, OuterRef, Q
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -30,6 +30,30 @@ from .templatetags import dutch_date
 from .utils import helpers
 
 
+# participants whose payment is paid or still open hold a place
+def reserved_participants(prefix=''):
+    return Q(**{f"{prefix}payment__status__in": (PaymentStatus.PAID, PaymentStatus.OPEN)})
+
+
+class EventQuerySet(models.QuerySet):
+
+    def with_capacity(self):
+        # one grouped query instead of a count per ticket for every property
+        available_tickets = Ticket.objects.filter(event=OuterRef('pk')).with_capacity().filter(reserved_count__lt=F('max_participants'))
+        return self.annotate(
+            reserved_count=Count('ticket__participant', filter=reserved_participants('ticket__participant__')),
+            has_available_tickets=Exists(available_tickets),
+        )
+
+
+class TicketQuerySet(models.QuerySet):
+
+    def with_capacity(self):
+        return self.annotate(
+            reserved_count=Count('participant', filter=reserved_participants('participant__')),
+        )
+
+
 class Event(models.Model):
 
     def __str__(self) -> str:
@@ -53,6 +77,8 @@ class Event(models.Model):
 
     history = HistoricalRecords(verbose_name=_("History"))
 
+    objects = EventQuerySet.as_manager()
+
     @property
     def is_in_future(self):
         brussels_tz = pytz.timezone('Europe/Brussels')
@@ -64,15 +90,21 @@ class Event(models.Model):
     def is_same_day(self):
         return self.start_date.strftime("%d/%m/%Y") == self.end_date.strftime("%d/%m/%Y")
     
+    def get_capacity(self):
+        # annotated by with_capacity(), otherwise fetched once for this object
+        if not hasattr(self, 'reserved_count'):
+            capacity = Event.objects.with_capacity().filter(pk=self.pk).values('reserved_count', 'has_available_tickets').get()
+            self.reserved_count = capacity['reserved_count']
+            self.has_available_tickets = capacity['has_available_tickets']
+
+        return self.reserved_count, self.has_available_tickets
+
     @property
     def is_sold_out(self):
-        # Total participants limit exceeded
-        event_sold_out = self.participants_count >= self.max_participants
+        reserved_count, has_available_tickets = self.get_capacity()
 
-        # All tickets have their max participants limit exceeded
-        tickets_are_sold_out = all(ticket.is_sold_out for ticket in self.ticket_set.all())
-
-        return tickets_are_sold_out or event_sold_out
+        # Total participants limit exceeded or all tickets have their max participants limit exceeded
+        return reserved_count >= self.max_participants or not has_available_tickets
 
     @property
     def remaining_tickets(self):
@@ -80,7 +112,7 @@ class Event(models.Model):
     
     @property
     def participants_count(self):
-        return sum(ticket.participants_count for ticket in self.ticket_set.all())
+        return self.get_capacity()[0]
 
 
 class Ticket(models.Model):
@@ -96,25 +128,23 @@ class Ticket(models.Model):
 
     history = HistoricalRecords(verbose_name=_("History"))
 
+    objects = TicketQuerySet.as_manager()
+
     @property 
     def is_sold_out(self):
-        amount_of_participants_with_this_as_ticket = Participant.objects.filter(ticket_id=self.pk).filter(
-            Q(payment__status=PaymentStatus.PAID) | 
-            Q(payment__status=PaymentStatus.OPEN)
-        ).count()
-        return amount_of_participants_with_this_as_ticket >= self.max_participants
+        return self.participants_count >= self.max_participants
     
     @property
     def remaining_tickets(self):
-        amount_of_participants_with_this_as_ticket = Participant.objects.filter(ticket_id=self.pk).count()
-        return self.max_participants - amount_of_participants_with_this_as_ticket
+        return self.max_participants - self.participants_count
     
     @property
     def participants_count(self):
-        return Participant.objects.filter(ticket_id=self.pk).filter(
-            Q(payment__status=PaymentStatus.PAID) | 
-            Q(payment__status=PaymentStatus.OPEN)
-        ).count()
+        # annotated by with_capacity(), otherwise counted once for this object
+        if not hasattr(self, 'reserved_count'):
+            self.reserved_count = Participant.objects.filter(reserved_participants(), ticket_id=self.pk).count()
+
+        return self.reserved_count
 
 
 
@@ -125,33 +155,36 @@ class PaymentStatus:
     CANCELED = "canceled"
     EXPIRED = "expired"
     FAILED = "failed"
-
+    # paid after it expired, when its places were already sold again, see tasks.process_mollie_notification
+    REFUNDED = "refunded"
 
     CHOICES = [
         (PAID, pgettext_lazy("payment status", "Paid")),
         (OPEN, pgettext_lazy("payment status", "Open")),
         (CANCELED, pgettext_lazy("payment status", "Canceled")),
         (EXPIRED, pgettext_lazy("payment status", "Expired")),
-        (FAILED, pgettext_lazy("payment status", "Failed"))
+        (FAILED, pgettext_lazy("payment status", "Failed")),
+        (REFUNDED, pgettext_lazy("payment status", "Refunded")),
     ]
 
 
 class Payment(models.Model):
-    
-    def save(self, *args, **kwargs):
-        # Check if payment is received
-        if self.status == PaymentStatus.PAID:
-            self.send_mail()
-
-        super().save(*args, **kwargs)
 
-
-    mollie_id = models.CharField(verbose_name=_("Mollie id"), blank=True, null=True)
+    class Meta:
+        indexes = [
+            # the open payments whose hold expired, see utils/inventory.py
+            models.Index(fields=["status", "created_at"], name="payment_status_created_at"),
+        ]
+    
+    mollie_id = models.CharField(verbose_name=_("Mollie id"), blank=True, null=True, db_index=True)
     first_name = models.CharField(max_length=50, verbose_name=_("First Name"), blank=True, null=True)
     last_name = models.CharField(max_length=50, verbose_name=_("Last Name"), blank=True, null=True)
     mail = models.EmailField(verbose_name=_("Email"), max_length=254, blank=True, null=True)
     status = models.CharField(max_length=10, choices=PaymentStatus.CHOICES, default=PaymentStatus.OPEN)
     amount = MoneyField(verbose_name="Price", default_currency="EUR", max_digits=10, decimal_places=2, blank=True, null=True)
+    created_at = models.DateTimeField(verbose_name=_("Created At"), default=timezone.now, editable=False)
+    # set once the tickets are mailed, see tasks.fulfil_payment
+    fulfilled_at = models.DateTimeField(verbose_name=_("Fulfilled At"), blank=True, null=True, editable=False)
 
     history = HistoricalRecords(verbose_name=_("History"))
 
@@ -242,7 +275,8 @@ class Participant(models.Model):
             self.random_seed = self._generate_random_seed()
         super().save(*args, **kwargs)
 
-    def _generate_random_seed(self):
+    @staticmethod
+    def _generate_random_seed():
         alphabet = string.ascii_letters + string.digits
         return ''.join(secrets.choice(alphabet) for _ in range(10))
     
@@ -320,4 +354,37 @@ class Participant(models.Model):
         response = HttpResponse(buffer, content_type='application/pdf')
         response['Content-Disposition'] = f'inline; filename="ticket-{self.pk}.pdf"'
 
-        return response
\ No newline at end of file
+        return response
+
+
+# Every call of the mollie webhook, the payment is updated by tasks.process_mollie_notification
+class MollieNotification(models.Model):
+    class Meta:
+        verbose_name = _("Mollie Notification")
+        verbose_name_plural = _("Mollie Notifications")
+        ordering = ["-received_at"]
+
+    def __str__(self) -> str:
+        return self.mollie_id
+
+    mollie_id = models.CharField(max_length=64, verbose_name=_("Mollie id"))
+    received_at = models.DateTimeField(default=timezone.now, verbose_name=_("Received At"))
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name=_("Processed At"))
+    # the status mollie reported
+    status = models.CharField(max_length=10, blank=True, verbose_name=_("Status"))
+
+
+class PaymentExpiryRun(models.Model):
+    class Meta:
+        verbose_name = _("Payment Expiry Run")
+        verbose_name_plural = _("Payment Expiry Runs")
+        ordering = ["-started_at"]
+        get_latest_by = "started_at"
+
+    def __str__(self) -> str:
+        return str(self.started_at)
+
+    started_at = models.DateTimeField(verbose_name=_("Started At"))
+    duration = models.FloatField(default=0, verbose_name=_("Duration (s)"))
+    amount_of_payments = models.PositiveIntegerField(default=0, verbose_name=_("Expired Payments"))
+    amount_of_participants = models.PositiveIntegerField(default=0, verbose_name=_("Released Places"))
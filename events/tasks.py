@@ -0,0 +1,90 @@
+from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MollieNotification, Payment, PaymentStatus
+from .payment import MollieClient
+from .utils import inventory
+
+
+@shared_task
+def expire_open_payments():
+    # abandoned checkouts would otherwise keep their places forever
+    run = inventory.expire_open_payments()
+    return f"{run.amount_of_payments} payments expired, {run.amount_of_participants} places released"
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def process_mollie_notification(notification_id):
+    notification = MollieNotification.objects.get(pk=notification_id)
+    if notification.processed_at is not None:
+        return f"notification {notification_id} was already processed"
+
+    # mollie only sends the id, the status has to be fetched
+    mollie_payment = MollieClient().client.payments.get(notification.mollie_id)
+    status = mollie_payment.get("status").lower()
+
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().filter(mollie_id=notification.mollie_id).first()
+
+        # duplicate notifications report the same status, those don't need a new history row.
+        # An open status is never newer than the one we have, a late duplicate could otherwise undo a paid one.
+        # A refunded payment stays refunded, mollie keeps reporting it as paid
+        if payment is not None and payment.status not in (status, PaymentStatus.REFUNDED) and status != PaymentStatus.OPEN:
+            if payment.status == PaymentStatus.EXPIRED and status == PaymentStatus.PAID:
+                # its places were given free, they have to be taken again before the tickets are mailed
+                try:
+                    inventory.reclaim(payment)
+                except inventory.SoldOut:
+                    status = PaymentStatus.REFUNDED
+                    transaction.on_commit(lambda: refund_payment.delay(payment.pk))
+
+            payment.status = status
+            payment.save()
+
+        notification.status = status
+        notification.processed_at = timezone.now()
+        notification.save()
+
+        if payment is not None and payment.status == PaymentStatus.PAID and payment.fulfilled_at is None:
+            transaction.on_commit(lambda: fulfil_payment.delay(payment.pk))
+
+    if payment is None:
+        return f"no payment with mollie id {notification.mollie_id}"
+
+    return f"payment {payment.pk} is {payment.status}"
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def fulfil_payment(payment_id):
+    # claimed with a single conditional update, so the tickets are only mailed once,
+    # however often the webhook or this task runs
+    claimed = Payment.objects.filter(pk=payment_id, status=PaymentStatus.PAID, fulfilled_at__isnull=True).update(fulfilled_at=timezone.now())
+    if not claimed:
+        return f"payment {payment_id} is not paid or already fulfilled"
+
+    try:
+        Payment.objects.get(pk=payment_id).send_mail()
+    except Exception:
+        # free the claim again, so the retry can mail them
+        Payment.objects.filter(pk=payment_id).update(fulfilled_at=None)
+        raise
+
+    return f"tickets of payment {payment_id} mailed"
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def refund_payment(payment_id):
+    # the payment was paid after it expired and its places were sold again in the meantime
+    payment = Payment.objects.get(pk=payment_id, status=PaymentStatus.REFUNDED)
+    mollie_payment = MollieClient().client.payments.get(payment.mollie_id)
+
+    # a retry after the refund was created doesn't refund it twice
+    if not mollie_payment.can_be_refunded() or float(mollie_payment.amount_remaining["value"]) <= 0:
+        return f"payment {payment_id} is already refunded"
+
+    mollie_payment.refunds.create(
+        {"amount": mollie_payment.amount_remaining, "description": "Uitverkocht"},
+        idempotency_key=f"refund-payment-{payment_id}",
+    )
+    return f"payment {payment_id} refunded"
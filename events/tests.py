@@ -1,3 +1,315 @@
-from django.test import TestCase
+import logging
+import time
+from smtplib import SMTPException
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from admin_app.models import SearchDocument
+
+from .models import Event, MollieNotification, Participant, Payment, PaymentExpiryRun, PaymentStatus, Ticket
+from .tasks import fulfil_payment, process_mollie_notification
+from .utils import inventory
+
+
+logger = logging.getLogger(__name__)
+
+# a very low bound, the throughput test only has to catch reservations that block each other for long
+MINIMUM_RESERVATIONS_PER_SECOND = 20
+
+
+def create_event(max_participants=10, **kwargs):
+    return Event.objects.create(
+        title="Benefiet", titel_sub="2025", description="", email_text="", location_long="",
+        start_date=timezone.now() + timedelta(days=30), end_date=timezone.now() + timedelta(days=30, hours=4),
+        max_participants=max_participants, location_short="Gent", image="events/benefiet.jpg",
+        google_maps_embed_url="https://maps.google.com", **kwargs,
+    )
+
+
+def create_ticket(event, max_participants=10, price=10):
+    return Ticket.objects.create(title="Volwassene", description="", price=price, max_participants=max_participants, event=event)
+
+
+def mollie_client(status):
+    client = mock.MagicMock()
+    client.return_value.client.payments.get.return_value = {"status": status}
+    return client
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentReservationTests(TransactionTestCase):
+    # real transactions, the reservations have to wait for each other's lock on the event
+
+    def reserve(self, ticket, number):
+        try:
+            inventory.reserve(ticket.event_id, {ticket: 1}, "Jan", f"Peeters {number}", "jan@example.com")
+            return True
+        except inventory.SoldOut:
+            return False
+        finally:
+            connection.close()
+
+    def reserve_in_parallel(self, ticket, attempts, workers=8):
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda number: self.reserve(ticket, number), range(attempts)))
+
+        return results, time.monotonic() - start
+
+    def test_sold_never_exceeds_capacity(self):
+        ticket = create_ticket(create_event(max_participants=100), max_participants=5)
+
+        results, _duration = self.reserve_in_parallel(ticket, attempts=40)
+
+        sold = Ticket.objects.with_capacity().get(pk=ticket.pk).reserved_count
+        self.assertEqual(sold, 5)
+        self.assertEqual(results.count(True), sold)
+
+    def test_event_capacity_over_tickets(self):
+        event = create_event(max_participants=6)
+        tickets = [create_ticket(event, max_participants=5), create_ticket(event, max_participants=5)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda number: self.reserve(tickets[number % 2], number), range(30)))
+
+        self.assertEqual(Event.objects.with_capacity().get(pk=event.pk).reserved_count, 6)
+
+    def test_throughput(self):
+        ticket = create_ticket(create_event(max_participants=1000), max_participants=1000)
+
+        results, duration = self.reserve_in_parallel(ticket, attempts=200)
+
+        self.assertTrue(all(results))
+        logger.info("%s parallel reservations of one ticket in %.2fs, %.0f per second", len(results), duration, len(results) / duration)
+        # the lock on the event serialises them, but each one only holds it for a few queries
+        self.assertGreater(len(results) / duration, MINIMUM_RESERVATIONS_PER_SECOND)
+
+
+class CapacityTests(TestCase):
+
+    def setUp(self):
+        self.event = create_event(max_participants=5)
+        self.small = create_ticket(self.event, max_participants=2)
+        self.large = create_ticket(self.event, max_participants=10)
+
+        inventory.reserve(self.event.pk, {self.small: 2, self.large: 1}, "Jan", "Peeters", "jan@example.com")
+        # a canceled payment gives its place free
+        canceled = inventory.reserve(self.event.pk, {self.large: 1}, "An", "Janssens", "an@example.com")
+        Payment.objects.filter(pk=canceled.pk).update(status=PaymentStatus.CANCELED)
+
+    def capacity(self, obj):
+        return obj.participants_count, obj.remaining_tickets, obj.is_sold_out
+
+    def test_annotated_and_counted_properties_agree(self):
+        self.assertEqual(self.capacity(Event.objects.with_capacity().get(pk=self.event.pk)), (3, 2, False))
+        self.assertEqual(self.capacity(Event.objects.get(pk=self.event.pk)), (3, 2, False))
+
+        for ticket, expected in ((self.small, (2, 0, True)), (self.large, (1, 9, False))):
+            self.assertEqual(self.capacity(Ticket.objects.with_capacity().get(pk=ticket.pk)), expected)
+            self.assertEqual(self.capacity(Ticket.objects.get(pk=ticket.pk)), expected)
+
+    def test_event_sold_out_when_every_ticket_is(self):
+        Ticket.objects.filter(pk=self.large.pk).update(max_participants=1)
+
+        self.assertTrue(Event.objects.with_capacity().get(pk=self.event.pk).is_sold_out)
+        self.assertTrue(Event.objects.get(pk=self.event.pk).is_sold_out)
+
+    def test_event_page_queries_independent_of_tickets(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(f'/events/{self.event.pk}/')
+
+        for number in range(5):
+            create_ticket(self.event)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(f'/events/{self.event.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        self.event = create_event(max_participants=100)
+        self.ticket = create_ticket(self.event, max_participants=100)
+
+    def reserve(self, amount):
+        with CaptureQueriesContext(connection) as queries:
+            payment = inventory.reserve(self.event.pk, {self.ticket: amount}, "Jan", "Peeters", "jan@example.com")
+
+        return payment, len(queries)
+
+    def test_participants_get_history_search_document_and_seed(self):
+        payment, _queries = self.reserve(10)
+
+        participants = Participant.objects.filter(payment=payment)
+        self.assertEqual(participants.count(), 10)
+        self.assertEqual(Participant.history.filter(payment=payment, history_type='+').count(), 10)
+        self.assertEqual(len(set(participants.values_list('random_seed', flat=True))), 10)
+
+        documents = SearchDocument.objects.filter(content_type=ContentType.objects.get_for_model(Participant))
+        self.assertEqual(set(documents.values_list('object_id', flat=True)), set(participants.values_list('pk', flat=True)))
+
+    def test_queries_independent_of_tickets(self):
+        _payment, few = self.reserve(10)
+        _payment, many = self.reserve(40)
+
+        self.assertEqual(many, few)
+
+
+class ExpireOpenPaymentsTests(TestCase):
+
+    def setUp(self):
+        event = create_event(max_participants=10)
+        self.ticket = create_ticket(event, max_participants=10)
+        self.old, self.new, self.paid = (
+            inventory.reserve(event.pk, {self.ticket: 2}, "Jan", f"Peeters {number}", "jan@example.com") for number in range(3)
+        )
+        Payment.objects.filter(pk__in=[self.old.pk, self.paid.pk]).update(created_at=timezone.now() - timedelta(hours=2))
+        Payment.objects.filter(pk=self.paid.pk).update(status=PaymentStatus.PAID)
+
+    def test_only_old_open_payments_expire(self):
+        run = inventory.expire_open_payments(hold_minutes=30)
+
+        statuses = dict(Payment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            self.old.pk: PaymentStatus.EXPIRED, self.new.pk: PaymentStatus.OPEN, self.paid.pk: PaymentStatus.PAID,
+        })
+        self.assertEqual((run.amount_of_payments, run.amount_of_participants), (1, 2))
+        self.assertEqual(Ticket.objects.with_capacity().get(pk=self.ticket.pk).reserved_count, 4)
+
+    def test_second_run_finds_nothing(self):
+        inventory.expire_open_payments(hold_minutes=30)
+        run = inventory.expire_open_payments(hold_minutes=30)
+
+        self.assertEqual(run.amount_of_payments, 0)
+        self.assertEqual(PaymentExpiryRun.objects.count(), 2)
+        self.assertEqual(Payment.history.filter(status=PaymentStatus.EXPIRED).count(), 1)
+
+
+class ExpiredPaymentTests(TestCase):
+
+    def setUp(self):
+        self.event = create_event(max_participants=2)
+        self.ticket = create_ticket(self.event, max_participants=2)
+        self.payment = inventory.reserve(self.event.pk, {self.ticket: 2}, "Jan", "Peeters", "jan@example.com")
+        Payment.objects.filter(pk=self.payment.pk).update(mollie_id="tr_expired", created_at=timezone.now() - timedelta(hours=2))
+        inventory.expire_open_payments(hold_minutes=30)
+
+    def notify(self, status):
+        notification = MollieNotification.objects.create(mollie_id="tr_expired")
+        with mock.patch('events.tasks.MollieClient', mollie_client(status)), \
+                mock.patch('events.tasks.fulfil_payment') as fulfil, mock.patch('events.tasks.refund_payment') as refund, \
+                self.captureOnCommitCallbacks(execute=True):
+            process_mollie_notification(notification.pk)
+
+        self.payment.refresh_from_db()
+        return fulfil, refund
+
+    def test_paid_after_expiry_with_places_left(self):
+        fulfil, refund = self.notify(PaymentStatus.PAID)
+
+        self.assertEqual(self.payment.status, PaymentStatus.PAID)
+        fulfil.delay.assert_called_once_with(self.payment.pk)
+        refund.delay.assert_not_called()
+
+    def test_paid_after_expiry_when_sold_out(self):
+        inventory.reserve(self.event.pk, {self.ticket: 2}, "An", "Janssens", "an@example.com")
+
+        fulfil, refund = self.notify(PaymentStatus.PAID)
+
+        self.assertEqual(self.payment.status, PaymentStatus.REFUNDED)
+        refund.delay.assert_called_once_with(self.payment.pk)
+        fulfil.delay.assert_not_called()
+        self.assertEqual(Ticket.objects.with_capacity().get(pk=self.ticket.pk).reserved_count, 2)
+
+    def test_refunded_payment_stays_refunded(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.REFUNDED)
+
+        fulfil, refund = self.notify(PaymentStatus.PAID)
+
+        self.assertEqual(self.payment.status, PaymentStatus.REFUNDED)
+        fulfil.delay.assert_not_called()
+        self.assertEqual(Ticket.objects.with_capacity().get(pk=self.ticket.pk).reserved_count, 0)
+
+
+class FulfilPaymentTests(TestCase):
+
+    def setUp(self):
+        event = create_event()
+        self.payment = inventory.reserve(event.pk, {create_ticket(event): 2}, "Jan", "Peeters", "jan@example.com")
+        Payment.objects.filter(pk=self.payment.pk).update(mollie_id="tr_paid")
+
+    def test_tickets_are_mailed_once(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.PAID)
+
+        with mock.patch.object(Payment, 'send_mail') as send_mail:
+            fulfil_payment(self.payment.pk)
+            fulfil_payment(self.payment.pk)
+
+        send_mail.assert_called_once()
+        self.payment.refresh_from_db()
+        self.assertIsNotNone(self.payment.fulfilled_at)
+
+    def test_failed_mail_frees_the_claim(self):
+        Payment.objects.filter(pk=self.payment.pk).update(status=PaymentStatus.PAID)
+
+        with mock.patch.object(Payment, 'send_mail', side_effect=SMTPException()), self.assertRaises(SMTPException):
+            fulfil_payment(self.payment.pk)
+
+        self.payment.refresh_from_db()
+        self.assertIsNone(self.payment.fulfilled_at)
+
+        # the retry mails them
+        with mock.patch.object(Payment, 'send_mail') as send_mail:
+            fulfil_payment(self.payment.pk)
+        send_mail.assert_called_once()
+
+    def test_open_payment_is_not_fulfilled(self):
+        with mock.patch.object(Payment, 'send_mail') as send_mail:
+            fulfil_payment(self.payment.pk)
+
+        send_mail.assert_not_called()
+
+    def test_duplicate_notifications_mail_once(self):
+        # every paid notification queues the task until it is fulfilled, the claim keeps it to one mail
+        with mock.patch('events.tasks.MollieClient', mollie_client(PaymentStatus.PAID)), \
+                mock.patch.object(fulfil_payment, 'delay', side_effect=fulfil_payment), \
+                mock.patch.object(Payment, 'send_mail') as send_mail:
+            for _number in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    process_mollie_notification(MollieNotification.objects.create(mollie_id="tr_paid").pk)
+
+        send_mail.assert_called_once()
+
+
+class MollieWebhookTests(TestCase):
+
+    def post(self, mollie_id):
+        with mock.patch('events.views.process_mollie_notification') as process, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/events/mollie-webhook/', {'id': mollie_id})
+
+        return response, process
+
+    def test_known_payment_is_queued(self):
+        Payment.objects.create(mollie_id="tr_known")
+
+        response, process = self.post("tr_known")
+
+        self.assertEqual(response.status_code, 200)
+        notification = MollieNotification.objects.get()
+        process.delay.assert_called_once_with(notification.pk)
+
+    def test_unknown_id_is_ignored(self):
+        response, process = self.post("tr_unknown")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(MollieNotification.objects.exists())
+        process.delay.assert_not_called()
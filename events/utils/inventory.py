@@ -0,0 +1,117 @@
+import time
+from datetime import timedelta
+
+from admin_app.utils import search_index
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from ..models import Event, Participant, Payment, PaymentExpiryRun, PaymentStatus, Ticket
+
+
+class SoldOut(Exception):
+    pass
+
+
+def check_places(event_id, amounts):
+    """
+    Lock the event and raise SoldOut when the amounts {ticket id: amount} don't fit anymore.
+    Has to run in a transaction, the lock is held until it ends.
+    """
+    # the event row is the lock: reservations of the same event wait for each other,
+    # so the counts below include every place that was taken before
+    Event.objects.select_for_update().filter(pk=event_id).exists()
+
+    event = Event.objects.with_capacity().get(pk=event_id)
+    tickets = Ticket.objects.with_capacity().in_bulk(list(amounts))
+
+    if sum(amounts.values()) > event.remaining_tickets:
+        raise SoldOut(event)
+
+    for ticket_id, amount in amounts.items():
+        if amount > tickets[ticket_id].remaining_tickets:
+            raise SoldOut(tickets[ticket_id])
+
+
+def reserve(event_id, amounts, first_name, last_name, mail):
+    """
+    Create the payment with a participant for every requested ticket, amounts is {ticket: amount}.
+    Raises SoldOut when the event or one of the tickets doesn't have enough places left.
+    """
+    with transaction.atomic():
+        check_places(event_id, {ticket.pk: amount for ticket, amount in amounts.items()})
+
+        payment = Payment.objects.create(
+            first_name=first_name,
+            last_name=last_name,
+            mail=mail,
+            amount=sum(amount * ticket.price.amount for ticket, amount in amounts.items()),
+        )
+
+        # every ticket needs its own participant object, all of them are inserted at once
+        participants = [
+            Participant(
+                first_name=first_name,
+                last_name=last_name,
+                mail=mail,
+                payment=payment,
+                attended=False,
+                ticket=ticket,
+                random_seed=Participant._generate_random_seed(),
+            )
+            for ticket, amount in amounts.items()
+            for i in range(amount)
+        ]
+        participants = bulk_create_with_history(participants, Participant)
+
+        # bulk_create sends no post_save, so the signals in admin_app don't index them
+        search_index.create_documents(participants)
+
+    return payment
+
+
+def expire_open_payments(hold_minutes=None):
+    """
+    Mark the open payments that are older than the hold window as expired, which gives their places free.
+    Stores and returns a PaymentExpiryRun with the amounts.
+    """
+    hold_minutes = settings.PAYMENT_HOLD_MINUTES if hold_minutes is None else hold_minutes
+    run = PaymentExpiryRun(started_at=timezone.now())
+    start = time.monotonic()
+
+    with transaction.atomic():
+        # locked, a webhook that marks one of them as paid in the meantime waits and wins afterwards.
+        # Payments that are locked by a webhook right now are skipped until the next run
+        payments = list(
+            Payment.objects.select_for_update(skip_locked=True)
+            .filter(status=PaymentStatus.OPEN, created_at__lt=run.started_at - timedelta(minutes=hold_minutes))
+        )
+
+        for payment in payments:
+            payment.status = PaymentStatus.EXPIRED
+
+        bulk_update_with_history(payments, Payment, ['status'], batch_size=500)
+
+        run.amount_of_payments = len(payments)
+        run.amount_of_participants = Participant.objects.filter(payment__in=payments).count() if payments else 0
+
+    run.duration = time.monotonic() - start
+    run.save()
+    return run
+
+
+def reclaim(payment):
+    """
+    Take the places of an expired payment again, for when it is paid after all.
+    Raises SoldOut when they were given to someone else in the meantime.
+    Has to run in the transaction that marks the payment as paid.
+    """
+    amounts = {}
+    for ticket_id, event_id in Participant.objects.filter(payment=payment).values_list('ticket', 'ticket__event'):
+        event_amounts = amounts.setdefault(event_id, {})
+        event_amounts[ticket_id] = event_amounts.get(ticket_id, 0) + 1
+
+    # always locked in the same order, so two of them can't wait for each other
+    for event_id in sorted(amounts):
+        check_places(event_id, amounts[event_id])
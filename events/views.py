@@ -1,7 +1,7 @@
 import json
-from decimal import Decimal
 
 from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
 from django.forms import ValidationError
 from django.http import HttpResponse, HttpResponseNotFound, HttpResponseRedirect, JsonResponse
 from django.shortcuts import (get_list_or_404, get_object_or_404, redirect,
@@ -10,14 +10,16 @@ from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import Event, Participant, Payment, Ticket
-from .utils import helpers
+from .models import Event, MollieNotification, Participant, Payment, PaymentStatus, Ticket
+from .tasks import process_mollie_notification
+from .utils import helpers, inventory
 from .payment import MollieClient
 
 
 def eventpage(request, id):
-    event = get_object_or_404(Event, pk=id)
-    tickets = get_list_or_404(Ticket, event_id=event.id)
+    # the capacity is annotated, so the template doesn't count the participants again
+    event = get_object_or_404(Event.objects.with_capacity(), pk=id)
+    tickets = get_list_or_404(Ticket.objects.with_capacity().order_by('pk'), event_id=event.id)
 
     context = {
         'event': event,
@@ -48,7 +50,7 @@ def buy_ticket(request, event_id):
         tickets = {}
         for possible_ticket in possible_tickets:
             amount_of_tickets = request.POST.get(f'ticket-form-number-{possible_ticket.pk}')
-            if amount_of_tickets != '':
+            if amount_of_tickets:
                 tickets[possible_ticket] = int(amount_of_tickets)
 
         # validation
@@ -67,38 +69,31 @@ def buy_ticket(request, event_id):
                 params={"mail": mail},
             )
 
-        total_cost = sum([amount*ticket.price.amount for ticket, amount in tickets.items()])
-
-        # create the corresponding objects
-        # payment object
-        payment = Payment.objects.create(
-            first_name=first_name,
-            last_name=last_name,
-            mail=mail,
-            amount=Decimal(total_cost)
-        )
-        
-        # every ticket needs its own participant object
-        for ticket, amount in tickets.items():
-            for i in range(amount):
-                p = Participant.objects.create(
-                    first_name = first_name,
-                    last_name = last_name,
-                    mail = mail,
-                    payment_id = payment.pk,
-                    attended = False,
-                    ticket_id = ticket.pk
-                )
-
-                p.save()
-        payment.save()
-
-        # create the mollie payment
-        mollie_payment = MollieClient().create_mollie_payment(
-            amount=Decimal(total_cost),
-            description=event.title,
-            payment_id=payment.pk
-        )
+        if not tickets:
+            return HttpResponseRedirect(f"/events/{event_id}/")
+
+        # create the payment and participants, only when there are enough places left
+        try:
+            payment = inventory.reserve(event.pk, tickets, first_name, last_name, mail)
+        except inventory.SoldOut:
+            return TemplateResponse(request, "paymentcallback.html", {
+                "title": "Uitverkocht!",
+                "description": "Er zijn niet genoeg tickets meer over voor uw bestelling.",
+                "event_id": event.id,
+            }, status=409)
+
+        # create the mollie payment, outside of the transaction so the event isn't locked while waiting on mollie
+        try:
+            mollie_payment = MollieClient().create_mollie_payment(
+                amount=payment.amount.amount,
+                description=event.title,
+                payment_id=payment.pk
+            )
+        except Exception:
+            # give the places free again
+            payment.status = PaymentStatus.FAILED
+            payment.save()
+            raise
 
         payment.mollie_id = mollie_payment.id
         payment.save()
@@ -162,12 +157,14 @@ def mollie_webhook(request):
         if 'id' not in request.POST:
             return HttpResponse(status=400)
 
-        mollie_payment_id = request.POST['id']
-        mollie_payment = MollieClient().client.payments.get(mollie_payment_id)
-        payment = get_object_or_404(Payment, mollie_id=mollie_payment_id)
+        # anyone can post here, ids of payments we don't know are not stored or queued.
+        # Mollie still gets a 200, it would otherwise keep retrying
+        if not Payment.objects.filter(mollie_id=request.POST['id']).exists():
+            return HttpResponse(status=200)
 
-        payment.status = mollie_payment.get("status").lower()
-        payment.save()
+        # only recorded here, mollie is asked for the status and the tickets are mailed by a celery task
+        notification = MollieNotification.objects.create(mollie_id=request.POST['id'])
+        transaction.on_commit(lambda: process_mollie_notification.delay(notification.pk))
 
         return HttpResponse(status=200)
 
@@ -17,6 +17,7 @@ from django.templatetags.static import static
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 import pytz
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -60,6 +61,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'simple_history',
     'dbbackup',
@@ -118,13 +120,43 @@ DATABASES = {
     }
 }
 
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://redis:6379/1',
+    }
+}
+
 # Celery
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_BROKER_CONNECTION_RETRY = True
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_DJANGO_CELERY_BEAT_TZ_AWARE = False
+CELERY_BEAT_SCHEDULE = {
+    'compact-read-state': {
+        'task': 'admin_app.tasks.compact_read_state',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'expire-open-payments': {
+        'task': 'events.tasks.expire_open_payments',
+        'schedule': crontab(minute='*/5'),
+    },
+    'delete-expired-exports': {
+        'task': 'admin_app.tasks.delete_expired_exports',
+        'schedule': crontab(minute=30),
+    },
+}
 DJANGO_CELERY_BEAT_TZ_AWARE = False
 
+# the fiscal certificates are rendered by a worker with the solo pool, see docker-compose.yml
+CELERY_TASK_ROUTES = {
+    'admin_app.tasks.generate_fiscal_certificates': {'queue': 'certificates'},
+}
+
+# open event payments hold their places this long, then they expire
+PAYMENT_HOLD_MINUTES = int(os.environ.get('PAYMENT_HOLD_MINUTES', 60))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -184,6 +216,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
 
+# exports and fiscal certificates hold personal data, they are kept outside of MEDIA_ROOT
+# (which nginx serves to anyone) and only handed out by views that check the user
+PRIVATE_ROOT = os.environ.get('PRIVATE_ROOT', os.path.join(BASE_DIR, 'privatefiles'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'private': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': PRIVATE_ROOT},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -201,6 +250,10 @@ UNFOLD = {
 
     "DASHBOARD_CALLBACK": "admin_app.views.dashboard_callback",
 
+    "SCRIPTS": [
+        lambda request: static("js/badges.js"),
+    ],
+
     "LOGIN": {
         "image": lambda request: static(random.choice(["img/login-bg.jpg", "img/login-bg2.jpg", "img/login-bg3.jpg"])),
     },
@@ -221,8 +274,13 @@ UNFOLD = {
         },
     },
     
+    "COMMAND": {
+        "search_callback": "admin_app.utils.search_index.search_callback",
+    },
+
     "SIDEBAR": {
-        "show_search": False,
+        "show_search": True,
+        "command_search": True,
         "show_all_applications": True,
         "navigation": [
             {